@@ -38,8 +38,12 @@ from .hmm import *
 from .core import *
 from .database import *
 from .parsers import *
+from .filters import *
+from .tables import *
+from .cache import *
 from .alignment import *
                  
+import os
 import json
 import time
 from itertools import chain, tee, combinations
@@ -53,6 +57,8 @@ class MetaEvent( MetaSegment ):
     useful data.
     '''
 
+    __slots__ = ()
+
     def __init__( self, **kwargs ):
         '''
         Just pass all the arguments to a MetaSegment.
@@ -245,6 +251,8 @@ class Event( Segment ):
     file containing useful data. 
     '''
 
+    __slots__ = ()
+
     def __init__( self, current, segments=[], **kwargs ):
         # If segments are provided, set an appropriate duration 
         if len(segments) > 0:
@@ -256,35 +264,51 @@ class Event( Segment ):
         Segment.__init__( self, current, filtered=False, segments=segments, **kwargs )            
 
          
-    def filter( self, order=1, cutoff=2000. ):
+    def filter( self, order=1, cutoff=2000., chunk_size=None ):
         '''
         Performs a bessel filter on the selected data, normalizing the cutoff frequency by the 
-        nyquist limit based on the sampling rate. 
+        nyquist limit based on the sampling rate. If chunk_size is given, the current is filtered
+        in place chunk_size samples at a time, which very long events need to avoid allocating
+        several padded copies of their current.
         '''
 
         if type(self) != Event:
             raise TypeError( "Cannot filter a metaevent. Must have the current." )
         from scipy import signal
 
-        nyquist = self.second / 2.
-
-        (b, a) = signal.bessel( order, cutoff / nyquist, btype='low', analog=0, output = 'ba' )
-        self.current = signal.filtfilt( b, a, self.current )
+        if chunk_size:
+            # Copy the current if it is a view, such as of the file's current, so
+            # that filtering in place does not change the current it came from.
+            current = self.current
+            if not isinstance( current, np.ndarray ) or not current.flags.owndata or \
+                current.dtype not in ( np.float32, np.float64 ):
+                current = np.array( current, dtype=np.float64 )
+            self.current = chunked_filtfilt( current, order, cutoff, self.second, chunk_size )
+        else:
+            (b, a) = bessel_coefficients( order, cutoff, self.second )
+            self.current = signal.filtfilt( b, a, self.current )
         self.filtered = True
         self.filter_order = order
         self.filter_cutoff = cutoff
 
-    def parse( self, parser=SpeedyStatSplit( prior_segments_per_second=10 ), hmm=None ):
+    def parse( self, parser=SpeedyStatSplit( prior_segments_per_second=10 ), hmm=None, cache=None ):
         '''
         Ensure that the data is filtered according to a bessel filter, and then applies a 
         plug-n-play state parser which must contain a .parse method. If a hmm is given, it will
         use a hmm to assist in the parsing. This occurs by segmenting the event using the parser,
         and then running the segments through the hmm, stringing together consecutive segments
         which yield the same state in the hmm. If no hmm is given, returns the raw parser
-        segmentation.
+        segmentation. If an AnalysisCache is given, the split points are loaded from it if this
+        parser has been run on this current before, and stored to it otherwise.
         '''
 
-        self.segments = parser.parse( self.current ) 
+        if cache is not None:
+            self.segments = cache.parse( self.current, parser, filtered=self.filtered,
+                filter_order=getattr( self, 'filter_order', None ),
+                filter_cutoff=getattr( self, 'filter_cutoff', None ) )
+        else:
+            self.segments = parser.parse( self.current ) 
+        self._summarize_segments()
         for segment in self.segments:
             segment.event = self
             segment.scale( float(self.file.second) )
@@ -333,6 +357,16 @@ class Event( Segment ):
             self.segments = segments
         self.state_parser = parser
 
+    def _summarize_segments( self ):
+        '''
+        Calculate the statistics of every segment which is a view of the current of this event
+        in a single pass over the current, and cache them in each segment, instead of having each
+        segment calculate its own separately. Segments which are not views are left to calculate
+        their own statistics when first asked.
+        '''
+
+        summarize_views( self.current, self.segments )
+
     def delete( self ):
         '''
         Delete all data associated with itself, including making the call on all segments if they
@@ -479,17 +513,25 @@ class Event( Segment ):
         plt.xlim( 0, self.duration )
 
     def to_meta( self ):
-        for prop in ['mean', 'std', 'duration', 'start', 'min', 'max', 'end', 'start']:
-            with ignored( AttributeError, KeyError ):
-                self.__dict__[prop] = getattr( self, prop )
+        '''
+        Convert this event and its segments to metadata form in place, removing all
+        references to the ionic current. Events and metaevents share the same layout,
+        so this swaps in the MetaEvent class rather than creating a new one. The statistics
+        of all segments which are views of the current are calculated in one pass first.
+        '''
 
+        stats = None
         with ignored( AttributeError ):
-            del self.current
+            stats = self._summary()
+            self._summarize_segments()
+            del self._current, self._stats
 
         for segment in self.segments:
             segment.to_meta()
 
-        self.__class__ = type( "MetaEvent", ( MetaEvent, ), self.__dict__ )
+        self.__class__ = MetaEvent
+        if stats is not None:
+            _, self.mean, self.std, self.min, self.max = stats
 
     def to_dict( self ):
         keys = ['mean', 'std', 'min', 'max', 'start', 'end', 'duration', 'filtered', 
@@ -521,9 +563,8 @@ class Event( Segment ):
 
         d = json.loads( _json )
 
-        event = MetaSegment() 
         if 'current' not in list(d.keys()):
-            event.__class__ = type("MetaEvent", (MetaEvent, ), d )
+            event = MetaEvent( **d )
         else:
             event = cls( d['current'], d['start'], )
 
@@ -540,26 +581,30 @@ class Event( Segment ):
             mean = np.mean([ seg.mean*seg.duration for seg in segments ]) / dur
             std = np.sqrt( sum( seg.std ** 2 * seg.duration for seg in segments ) / dur )
 
-            self = cls( current=np.array([ seg.mean for seg in segments ]), start=0, 
-                segments=segments, mean=mean, std=std )
-            self.__class__ = type( "MetaEvent", (Event,), self.__dict__ )
-            return self
+            return MetaEvent( start=0, end=dur, duration=dur, segments=segments, mean=mean,
+                std=std )
 
     @classmethod
-    def from_database( cls, database, host, password, user, AnalysisID, SerialID ):
-        db = MySQLDatabaseInterface(db=database, host=host, password=password, user=user)
-
-        EventID, start, end = db.read( "SELECT ID, start, end FROM Events \
-                                        WHERE AnalysisID = {0} \
-                                        AND SerialID = {1}".format(AnalysisID, SerialID) )[0]
-
-        state_query = np.array( db.read( "SELECT start, end, mean, std FROM Segments \
-                                          WHERE EventID = {}".format(EventID) ) )
+    def from_database( cls, database, host, password, user, AnalysisID, SerialID, pool_size=None ):
+        with connect(database, host=host, password=password, user=user, pool_size=pool_size) as db:
+
+            EventID, start, end = db.read( "SELECT ID, start, end FROM Events \
+                                            WHERE AnalysisID = {0} \
+                                            AND SerialID = {1}".format(AnalysisID, SerialID) )[0]
+
+            if db.has_packed_segments( AnalysisID ):
+                blob = db.read( "SELECT Segments FROM SegmentBlobs \
+                                 WHERE EventID = {}".format(EventID) )
+                state_query = [ np.asarray( column, dtype=np.float64 ) for column in
+                                unpack_segments( blob[0][0] ) ] if blob else [ [] ]*4
+            else:
+                state_query = db.read_arrays( "SELECT start, end, mean, std FROM Segments \
+                                               WHERE EventID = {}".format(EventID), dtypes=[ np.float64 ]*4 )
         
-        segments = [ MetaSegment( start=start, end=end, mean=mean, 
-                                  std=std, duration=end-start ) for start, end, mean, std in state_query ]
+            segments = [ MetaSegment( start=start, end=end, mean=mean, 
+                                      std=std, duration=end-start ) for start, end, mean, std in zip( *state_query ) ]
 
-        Event.from_segments( cls, segments )
+        return cls.from_segments( segments )
 
     @property
     def n( self ):
@@ -574,9 +619,11 @@ class File( Segment ):
         # Must either provide the current and timestep, or the filename
         if current is not None and timestep is not None:
             filename = ""
+            owns_current = False
         elif filename and current is None and timestep is None:
             timestep, current = read_abf( filename )
             filename = filename.split("\\")[-1].split(".abf")[0]
+            owns_current = True
         else:
             raise SyntaxError( "Must provide current and timestep, or filename \
                 corresponding to a valid abf file." )
@@ -584,24 +631,74 @@ class File( Segment ):
         Segment.__init__( self, current=current, filename=filename, second=1000./timestep, 
                                 events=[], sample=None )
 
+        # Only a current read from a file belongs to the file, and may be filtered in place.
+        self._owns_current = owns_current
+
     def __getitem__( self, index ):
         return self.events[ index ]
 
-    def parse( self, parser = lambda_event_parser( threshold=90 ) ):
+    def parse( self, parser = lambda_event_parser( threshold=90 ), cache=None ):
         '''
         Applies one of the plug-n-play event parsers for event detection. The parser must have a .parse method
-        which returns a tuple corresponding to the start of each event, and the ionic current in them. 
+        which returns a tuple corresponding to the start of each event, and the ionic current in them. If an
+        AnalysisCache is given, the events are loaded from it if this parser has been run on this current
+        before, and stored to it otherwise.
         '''
         
+        if cache is not None:
+            segments = cache.parse( self.current, parser )
+        else:
+            segments = parser.parse( self.current )
+
         self.events = [ Event( current=seg.current,
                                start=seg.start / self.second,
                                end=(seg.start+seg.duration) / self.second,
                                duration=seg.duration / self.second,
                                second=self.second,
-                               file=self ) for seg in parser.parse( self.current ) ]
+                               file=self ) for seg in segments ]
 
         self.event_parser = parser
 
+    def filter( self, order=1, cutoff=2000., chunk_size=2**20 ):
+        '''
+        Performs a bessel filter on the whole file at once, using cached second-order-section
+        coefficients, instead of designing and running a filter for each event. The filter is
+        run in place chunk_size samples at a time, so only O(chunk_size) extra memory is used.
+        Events which have already been detected are replaced by views of the filtered current,
+        so their edges are filtered using the surrounding current rather than padding. Events
+        should be filtered before they are segmented. A current passed in, rather than read
+        from an .abf file, is copied first, so that the caller's array is left unfiltered. A
+        file can only be filtered once.
+        '''
+
+        if getattr( self, 'filtered', False ):
+            raise ValueError( "File has already been filtered with order {} and cutoff {}.".format(
+                self.filter_order, self.filter_cutoff ) )
+
+        # Copy the current unless it was read by this file, so that filtering in place
+        # does not change an array which belongs to the caller.
+        current = np.asarray( self.current )
+        if current.dtype not in ( np.float32, np.float64 ):
+            current = current.astype( np.float64 )
+        elif not getattr( self, '_owns_current', False ) or not current.flags.owndata:
+            current = current.copy()
+
+        self.current = chunked_filtfilt( current, order, cutoff, self.second, chunk_size )
+        self._owns_current = True
+        self.filtered = True
+        self.filter_order = order
+        self.filter_cutoff = cutoff
+
+        for event in self.events:
+            if not isinstance( event, Event ):
+                continue
+
+            start = int( round( event.start * self.second ) )
+            event.current = self.current[ start:start+len( event.current ) ]
+            event.filtered = True
+            event.filter_order = order
+            event.filter_cutoff = cutoff
+
     def close( self ):
         '''
         Close the file, deleting all data associated with it. A wrapper for the delete function.
@@ -684,10 +781,12 @@ class File( Segment ):
     def to_meta( self ):
         '''
         Remove the ionic current stored for this file, and do the same for all underlying
-        structures in order to remove all references to that list. 
+        structures in order to remove all references to that list. The statistics of all
+        events which are views of the current are calculated in one pass first.
         '''
         
         with ignored( AttributeError ):
+            summarize_views( self.current, self.events )
             del self.current
 
         for event in self.events:
@@ -706,29 +805,26 @@ class File( Segment ):
         d['name'] = self.__class__.__name__
         return d
 
-    def to_json( self, filename=None ):
+    def to_json( self, filename=None, currents=None ):
         '''
         Return a json (in the form of a string) that represents the file, and allows for
-        reconstruction of the instance from, using cls.from_json. 
+        reconstruction of the instance from, using cls.from_json. If currents is 'float32' or
+        'int16', the current of every event is also written, as that type, to a binary file
+        next to the json with the extension .currents, so that from_json can load the currents
+        directly instead of reading the .abf and filtering every event again. int16 currents
+        are scaled to the range of each event, which is accurate to within 1/65534th of it.
         '''
         
         d = self.to_dict()
-
-        devents = []
-        for event in d['events']:
-            devent = event.to_dict()
-            try:
-                devent['segments'] = [ state.to_dict() for state in devent['segments'] ]
-                devent['state_parser'] = devent['state_parser'].to_dict()
-            except:
-                with ignored( KeyError, AttributeError ):
-                    del devent['segments']
-                    del devent['state_parser']
-            devents.append( devent )
-
-        d['events'] = devents
+        d['events'] = [ self._event_dict( event ) for event in d['events'] ]
         d['event_parser'] = d['event_parser'].to_dict()
 
+        if currents is not None:
+            if not filename:
+                raise ValueError( "Must give a filename to store currents alongside the json." )
+            d['currents'] = self._write_currents( os.path.splitext( filename )[0] + '.currents',
+                currents )
+
         _json = json.dumps( d, indent=4, separators=( ',', ' : ' ) )
 
         if filename:
@@ -736,6 +832,188 @@ class File( Segment ):
                 outfile.write( _json )
         return _json
 
+    def _write_currents( self, filename, dtype ):
+        '''
+        Write the current of every event, one after another, to a binary file as little-endian
+        float32 or int16, and return a dictionary of where each event lies in it. int16 currents
+        are stored as ( current - shift ) / scale, with a scale and shift for each event.
+        '''
+
+        if dtype not in ( 'float32', 'int16' ):
+            raise ValueError( "Currents must be stored as 'float32' or 'int16'." )
+
+        offsets, scales, shifts = [0], [], []
+        with open( filename, 'wb' ) as outfile:
+            for event in self.events:
+                current = np.asarray( event.current, dtype=np.float64 )
+
+                if dtype == 'int16':
+                    low, high = ( current.min(), current.max() ) if len( current ) > 0 else ( 0., 0. )
+                    scale, shift = ( high - low ) / 65534. or 1., ( high + low ) / 2.
+                    data = np.round( ( current - shift ) / scale ).astype( '<i2' )
+                    scales.append( scale )
+                    shifts.append( shift )
+                else:
+                    data = current.astype( '<f4' )
+
+                data.tofile( outfile )
+                offsets.append( offsets[-1] + len( data ) )
+
+        block = { 'filename' : os.path.basename( filename ), 'dtype' : dtype,
+                  'second' : self.second, 'offsets' : offsets }
+        if dtype == 'int16':
+            block['scales'], block['shifts'] = scales, shifts
+        return block
+
+    @classmethod
+    def _from_json_currents( cls, d, directory ):
+        '''
+        Reconstruct a file from the dictionary of a json which stored the currents of its events
+        alongside it, reading them from the .currents file in the directory rather than reading
+        the .abf file and filtering each event again.
+        '''
+
+        block = d['currents']
+        second = block['second']
+        offsets = block['offsets']
+        dtype = np.dtype( '<f4' if block['dtype'] == 'float32' else '<i2' )
+
+        if offsets[-1] > 0:
+            blob = np.memmap( os.path.join( directory, block['filename'] ), dtype=dtype, mode='r' )
+        else:
+            blob = np.array( [], dtype=dtype )
+
+        file = File( current=np.array([]), timestep=1000./second )
+        file.filename = d['filename']
+        with ignored( KeyError, TypeError ):
+            file.event_parser = parser.from_json( json.dumps( d['event_parser'] ) )
+
+        for i, _json in enumerate( d['events'] ):
+            current = blob[ offsets[i]:offsets[i+1] ]
+            if block['dtype'] == 'int16':
+                current = current * np.float32( block['scales'][i] ) + np.float32( block['shifts'][i] )
+
+            event = Event( current=current, second=second, file=file,
+                **{ key: _json[key] for key in ( 'start', 'end', 'duration' ) if key in _json } )
+
+            event.segments = []
+            for s_json in _json.get( 'segments', [] ):
+                start = s_json['start']
+                end = s_json.get( 'end', start + s_json.get( 'duration', 0 ) )
+                si, ei = int( round( start*second ) ), int( round( end*second ) )
+
+                segment = Segment( current=current[si:ei], start=start, end=end, duration=end-start )
+                segment.event = event
+                event.segments.append( segment )
+
+            event.state_parser = None
+            with ignored( KeyError, TypeError ):
+                event.state_parser = parser.from_json( json.dumps( _json['state_parser'] ) )
+            for key in 'filtered', 'filter_order', 'filter_cutoff':
+                with ignored( KeyError ):
+                    setattr( event, key, _json[key] )
+            file.events.append( event )
+
+        return file
+
+    @staticmethod
+    def _event_dict( event ):
+        '''
+        Return the dictionary of an event which is stored in a json, with its segments and
+        state parser converted to dictionaries as well.
+        '''
+
+        devent = event.to_dict()
+        try:
+            devent['segments'] = [ state.to_dict() for state in devent['segments'] ]
+            devent['state_parser'] = devent['state_parser'].to_dict()
+        except:
+            with ignored( KeyError, AttributeError ):
+                del devent['segments']
+                del devent['state_parser']
+        return devent
+
+    def to_jsonl( self, filename, events=None ):
+        '''
+        Write the file to JSON Lines, with a header line holding the filename, sampling rate,
+        and event parser, followed by one line for each event and its segments. Each event is
+        written as soon as it is converted, so the whole json is never held in memory. Events
+        can be any iterable of events, such as a generator which parses them one at a time,
+        and defaults to the events of this file.
+        '''
+
+        header = { 'name' : 'File', 'filename' : self.filename, 'second' : self.second }
+        with ignored( AttributeError ):
+            header['event_parser'] = self.event_parser.to_dict()
+
+        with open( filename, 'w' ) as outfile:
+            outfile.write( json.dumps( header ) + '\n' )
+            for event in ( self.events if events is None else events ):
+                outfile.write( json.dumps( self._event_dict( event ) ) + '\n' )
+
+    @classmethod
+    def iter_jsonl( cls, filename ):
+        '''
+        Read the events from a JSON Lines file written by to_jsonl one at a time, yielding a
+        metaevent with metasegments for each, so that memory use does not grow with the number
+        of events in the file.
+        '''
+
+        with open( filename, 'r' ) as infile:
+            header = json.loads( next( infile ) )
+            if header.get( 'name' ) != "File":
+                raise TypeError( "JSON Lines does not encode a file" )
+
+            for line in infile:
+                if line.strip():
+                    yield cls._event_from_dict( json.loads( line ) )
+
+    @classmethod
+    def from_jsonl( cls, filename ):
+        '''
+        Read in a JSON Lines file written by to_jsonl, and produce a file instance holding a
+        metaevent for each event. The .abf file is not read.
+        '''
+
+        with open( filename, 'r' ) as infile:
+            header = json.loads( next( infile ) )
+        if header.get( 'name' ) != "File":
+            raise TypeError( "JSON Lines does not encode a file" )
+
+        file = File( current=np.array([]), timestep=1000./header.get( 'second', 100000. ) )
+        file.filename = header.get( 'filename', "" )
+        with ignored( KeyError, TypeError ):
+            file.event_parser = parser.from_json( json.dumps( header['event_parser'] ) )
+
+        for event in cls.iter_jsonl( filename ):
+            event.file = file
+            for segment in event.segments:
+                segment.event = event
+            file.events.append( event )
+        return file
+
+    @staticmethod
+    def _event_from_dict( d ):
+        '''
+        Return a metaevent, with its metasegments and state parser, from the dictionary of an
+        event stored in a json.
+        '''
+
+        segments = d.pop( 'segments', [] )
+        state_parser = d.pop( 'state_parser', None )
+        d.pop( 'name', None )
+
+        for s in segments:
+            s.pop( 'name', None )
+
+        event = MetaEvent( **d )
+        event.segments = [ MetaSegment( **s ) for s in segments ]
+
+        event.state_parser = None
+        with ignored( TypeError, KeyError, AttributeError ):
+            event.state_parser = parser.from_json( json.dumps( state_parser ) )
+        return event
+
     @classmethod
     def from_json( cls, _json ):
         '''
@@ -743,7 +1021,9 @@ class File( Segment ):
         instances. 
         '''
 
+        directory = ""
         if _json.endswith(".json"):
+            directory = os.path.dirname( _json )
             with open( _json, 'r' ) as infile:
                 _json = ''.join(line for line in infile)
 
@@ -752,6 +1032,10 @@ class File( Segment ):
         if d['name'] != "File":
             raise TypeError( "JSON does not encode a file" )
 
+        # If the currents were stored alongside the json, load them instead of the .abf
+        if 'currents' in d:
+            return cls._from_json_currents( d, directory )
+
         try:
             file = File( filename=d['filename']+".abf" )
             meta = False
@@ -796,146 +1080,399 @@ class File( Segment ):
 
         return file
 
+    def to_binary( self, directory, currents=False, dtype=None ):
+        '''
+        Save the analysis of this file to a directory in a binary format, which is much smaller
+        and faster to load than a json. The metadata of the events and segments are stored as
+        one .npy file per column of their EventTable and SegmentTable, alongside header.json,
+        which holds the filename, sampling rate, filter parameters, and parser parameters. If
+        currents is True, the current of every event is also stored, one after another, in
+        currents.npy, with the offset of each event in current_offsets.npy. The currents are
+        stored as dtype, defaulting to the type of the event currents.
+        '''
+
+        if not os.path.isdir( directory ):
+            os.makedirs( directory )
+
+        header = self._header()
+        header['currents'] = bool( currents )
+
+        EventTable.from_files( [ self ] ).save( directory, 'events' )
+        SegmentTable.from_files( [ self ] ).save( directory, 'segments' )
+
+        if currents:
+            lengths = [ len( event.current ) for event in self.events ]
+            offsets = np.concatenate( ( [0], np.cumsum( lengths, dtype=np.int64 ) ) )
+            if dtype is None:
+                dtype = np.result_type( np.float32,
+                    *{ np.asarray( event.current ).dtype for event in self.events } )
+
+            # Write each event straight into the file, rather than concatenating them first.
+            out = np.lib.format.open_memmap( os.path.join( directory, 'currents.npy' ), mode='w+',
+                dtype=dtype, shape=( int( offsets[-1] ), ) )
+            for event, start, end in zip( self.events, offsets[:-1], offsets[1:] ):
+                out[start:end] = event.current
+            out.flush()
+            del out
+
+            np.save( os.path.join( directory, 'current_offsets.npy' ), offsets )
+
+        with open( os.path.join( directory, 'header.json' ), 'w' ) as outfile:
+            outfile.write( json.dumps( header, indent=4, separators=( ',', ' : ' ) ) )
+
+    def _header( self ):
+        '''
+        Return a dict of the filename, sampling rate, filter parameters, and parser parameters
+        of this file, which along with its tables are enough to rebuild it using _from_tables.
+        '''
+
+        header = { 'name' : 'File', 'version' : 1, 'filename' : self.filename,
+                   'second' : self.second }
+        with ignored( AttributeError ):
+            header['event_parser'] = self.event_parser.to_dict()
+        with ignored( AttributeError, IndexError ):
+            header['state_parser'] = self.events[0].state_parser.to_dict()
+        for key in 'filtered', 'filter_order', 'filter_cutoff':
+            with ignored( AttributeError, IndexError ):
+                header[key] = getattr( self.events[0], key )
+        return header
+
+    @classmethod
+    def from_binary( cls, directory, mmap=True ):
+        '''
+        Load an analysis saved with to_binary. By default the columns and currents are memory
+        mapped rather than read, so loading is quick and only what is used is read from disk.
+        If the currents were saved, events and segments are views of them, with their
+        statistics taken from the saved tables, otherwise they are metaevents and metasegments.
+        The .abf file is not needed, and the file itself holds no current.
+        '''
+
+        with open( os.path.join( directory, 'header.json' ), 'r' ) as infile:
+            header = json.load( infile )
+
+        if header.get( 'name' ) != "File":
+            raise TypeError( "Directory does not encode a file" )
+
+        mmap_mode = 'r' if mmap else None
+        events = EventTable.load( directory, 'events', mmap_mode )
+        segments = SegmentTable.load( directory, 'segments', mmap_mode )
+
+        currents, offsets = None, None
+        if header.get( 'currents' ):
+            currents = np.load( os.path.join( directory, 'currents.npy' ), mmap_mode=mmap_mode )
+            offsets = np.load( os.path.join( directory, 'current_offsets.npy' ) )
+
+        return cls._from_tables( header, events, segments, currents, offsets )
+
+    @classmethod
+    def _from_tables( cls, header, events, segments, currents=None, offsets=None ):
+        '''
+        Build a file from the EventTable and SegmentTable of its events and segments, and a
+        header dict as written by to_binary. If the currents of the events are given, along
+        with the offset of each event into them, then events and segments are views of them,
+        otherwise they are metaevents and metasegments.
+        '''
+
+        second = header.get( 'second', 100000. )
+        file = File( current=np.array([]), timestep=1000./second )
+        file.filename = header.get( 'filename', "" )
+
+        with ignored( KeyError, TypeError ):
+            file.event_parser = parser.from_json( json.dumps( header['event_parser'] ) )
+
+        state_parser = None
+        with ignored( KeyError, TypeError ):
+            state_parser = parser.from_json( json.dumps( header['state_parser'] ) )
+
+        filtered = header.get( 'filtered', False )
+        filter_params = { key: header[key] for key in ( 'filter_order', 'filter_cutoff' )
+                          if key in header }
+
+        # Segments are stored in event order, so find where each event's segments lie.
+        bounds = np.searchsorted( segments.event, np.arange( len( events ) + 1 ) )
+        event_rows = zip( *[ events[key].tolist() for key in ( 'start', 'end', 'duration', 'mean',
+                                                               'std', 'min', 'max' ) ] )
+        segment_rows = list( zip( *[ segments[key].tolist() for key in ( 'start', 'end',
+                                     'duration', 'mean', 'std', 'min', 'max' ) ] ) )
+
+        for i, ( start, end, duration, mean, std, minimum, maximum ) in enumerate( event_rows ):
+            rows = segment_rows[ bounds[i]:bounds[i+1] ]
+
+            if currents is None:
+                event = MetaEvent( start=start, end=end, duration=duration, mean=mean, std=std,
+                                   min=minimum, max=maximum, second=second, file=file )
+                event.segments = [ MetaSegment( start=s, end=e, duration=d, mean=m, std=sd,
+                                                min=mn, max=mx, event=event )
+                                   for s, e, d, m, sd, mn, mx in rows ]
+            else:
+                current = currents[ offsets[i]:offsets[i+1] ]
+                event = Event( current=current, start=start, end=end, duration=duration,
+                               second=second, file=file )
+                event._stats = ( len( current ), mean, std, minimum, maximum )
+
+                event.segments = []
+                for s, e, d, m, sd, mn, mx in rows:
+                    si, ei = int( round( s*second ) ), int( round( e*second ) )
+                    segment = Segment( current=current[si:ei], start=s, end=e, duration=d )
+                    segment._stats = ( ei-si, m, sd, mn, mx )
+                    segment.event = event
+                    event.segments.append( segment )
+
+            event.state_parser = state_parser
+            event.filtered = filtered
+            for key, value in filter_params.items():
+                setattr( event, key, value )
+            file.events.append( event )
+
+        return file
+
     @classmethod 
     def from_database( cls, database, host, password, user, AnalysisID=None, filename=None,
                        eventDetector=None, eventDetectorParams=None, segmenter=None,
-                       segmenterParams=None, filterCutoff=None, filterOrder=None  ):
+                       segmenterParams=None, filterCutoff=None, filterOrder=None, mirror=None,
+                       pool_size=None ):
         '''
         Loads the cache for the file, if this exists. Can either provide the AnalysisID to unambiguously
         know which analysis to use, or the filename if you want the most recent analysis done on that file.
+        If host is None, database is the path of a local SQLite database instead of a MySQL database.
+        Whether the segments were stored as rows or packed into blobs is detected from the database.
+        If a DatabaseMirror is given, the events and segments are read from its local copy of the
+        analysis, which is only fetched from the database if it is missing or out of date.
+        If pool_size is given, the pool of connections to the database keeps that many idle.
         '''
         
-        db = MySQLDatabaseInterface(db=database, host=host, password=password, user=user)
-
-        keys = ( "ID", "Filename", "EventDetector", "EventDetectorParams",
-                 "segmenter", "segmenterParams", "FilterCutoff", "FilterOrder" )
-        vals = ( AnalysisID, filename, eventDetector, eventDetectorParams, segmenter,
-                 segmenterParams, filterCutoff, filterOrder )
-
-        query_list = []
-        for key, val in zip( keys, vals ):
-            if val:
-                if key not in ['ID', 'FilterCutoff', 'FilterOrder']:
-                    query_list += ["{key} = '{val}'".format( key=key, val=val )]
-                else:
-                    query_list += ["{key} = {val}".format( key=key, val=val )]
+        with connect(database, host=host, password=password, user=user, pool_size=pool_size) as db:
+
+            keys = ( "ID", "Filename", "EventDetector", "EventDetectorParams",
+                     "segmenter", "segmenterParams", "FilterCutoff", "FilterOrder" )
+            vals = ( AnalysisID, filename, eventDetector, eventDetectorParams, segmenter,
+                     segmenterParams, filterCutoff, filterOrder )
+
+            query_list = []
+            for key, val in zip( keys, vals ):
+                if val:
+                    if key not in ['ID', 'FilterCutoff', 'FilterOrder']:
+                        query_list += ["{key} = '{val}'".format( key=key, val=val )]
+                    else:
+                        query_list += ["{key} = {val}".format( key=key, val=val )]
 
-        query = "SELECT * FROM AnalysisMetadata WHERE "+" AND ".join(query_list)+" ORDER BY TimeStamp DESC" 
+            query = "SELECT * FROM AnalysisMetadata WHERE "+" AND ".join(query_list)+" ORDER BY TimeStamp DESC, ID DESC"
 
-        try:
-            filename, _, AnalysisID = db.read( query )[0][0:3]
-        except:
-            raise DatabaseError("No analysis found with given parameters.")
+            try:
+                filename, timestamp, AnalysisID = db.read( query )[0][0:3]
+            except:
+                raise DatabaseError("No analysis found with given parameters.")
 
-        try:
-            file = File(filename+".abf")
-        except:
-            raise IOError("File must be in local directory to parse from database.")
+            try:
+                file = File(filename+".abf")
+            except:
+                raise IOError("File must be in local directory to parse from database.")
 
-        query = np.array( db.read( "SELECT ID, SerialID, start, end FROM Events \
-                                    WHERE AnalysisID = {0}".format(AnalysisID) ) )
-        EventID, SerialID, starts, ends = query[:, 0], query[:, 1], query[:, 2], query[:,3]
-        starts, ends = list(map( int, starts )), list(map( int, ends ))
-        
-        file.parse( parser=MemoryParse( starts, ends ) )
-
-        for i in SerialID:
-            state_query = np.array( db.read( "SELECT start, end FROM Segments \
-                                              WHERE EventID = {}".format(EventID[i]) ) )
-            with ignored( IndexError ):
-                starts, ends = state_query[:,0], state_query[:,1]
-                file.events[i].parse( parser=MemoryParse( starts, ends ) )
-        
-        return file
+            if mirror is None:
+                file._from_database( db, AnalysisID )
+            else:
+                with mirror.read_analysis( db, AnalysisID, timestamp ) as local:
+                    file._from_database( local, AnalysisID )
 
+            return file
 
-    def to_database( self, database, host, password, user ):
+    def _from_database( self, db, AnalysisID ):
+        '''
+        Parse the file using the events and segments of an analysis stored in a database,
+        whichever way its segments were stored.
+        '''
+
+        if db.has_packed_segments( AnalysisID ):
+            self._from_database_packed( db, AnalysisID )
+        else:
+            self._from_database_rows( db, AnalysisID )
+
+    def _from_database_rows( self, db, AnalysisID ):
+        '''
+        Parse the file using the events of an analysis, and the rows of the segments of
+        each event.
+        '''
+
+        # Read every event and all of its segments in a single query, with one row per segment,
+        # or a single row with NULL segment columns for an event without segments.
+        # The rows are streamed into arrays, so the result is never held as python tuples.
+        SerialID, event_starts, event_ends, starts, ends = db.read_arrays(
+            "SELECT Events.SerialID, Events.start, Events.end, Segments.start, Segments.end \
+             FROM Events LEFT JOIN Segments ON Segments.EventID = Events.ID \
+             WHERE Events.AnalysisID = {0} \
+             ORDER BY Events.SerialID, Segments.SerialID".format(AnalysisID),
+            dtypes=( np.int64, np.float64, np.float64, np.float64, np.float64 ) )
+
+        first = np.concatenate( ( [True], SerialID[1:] != SerialID[:-1] ) )
+        self.parse( parser=MemoryParse( np.rint( event_starts[first] ).astype( int ).tolist(),
+                                        np.rint( event_ends[first] ).astype( int ).tolist() ) )
+
+        # Split the segments by event, using the serial IDs they are sorted by.
+        events = SerialID[first]
+        segmented = ~np.isnan( starts )
+        SerialID, starts, ends = SerialID[segmented], starts[segmented], ends[segmented]
+        lows = np.searchsorted( SerialID, events, side='left' )
+        highs = np.searchsorted( SerialID, events, side='right' )
+
+        for event, low, high in zip( self.events, lows, highs ):
+            if high > low:
+                event.parse( parser=MemoryParse( np.rint( starts[low:high] ),
+                                                 np.rint( ends[low:high] ) ) )
+
+    def _from_database_packed( self, db, AnalysisID ):
+        '''
+        Parse the file using the events of an analysis, and the segments of each event
+        from the blob it was packed into.
+        '''
+
+        query = db.read( "SELECT Events.start, Events.end, SegmentBlobs.Segments \
+                          FROM Events LEFT JOIN SegmentBlobs ON SegmentBlobs.EventID = Events.ID \
+                          WHERE Events.AnalysisID = {0} \
+                          ORDER BY Events.SerialID".format(AnalysisID) )
+
+        self.parse( parser=MemoryParse( [ int( round( start ) ) for start, _, _ in query ],
+                                        [ int( round( end ) ) for _, end, _ in query ] ) )
+
+        for event, ( _, _, blob ) in zip( self.events, query ):
+            if blob is not None:
+                starts, ends, _, _ = unpack_segments( blob )
+                event.parse( parser=MemoryParse( starts, ends ) )
+
+
+    def to_database( self, database, host, password, user, packed=False, pool_size=None ):
         '''
         Caches the file to the database. This will create an entry in the AnalysisMetadata table
         for this file, and will add each event to the Event table, and each Segment to the Segment
         table. The split points are stored de facto due to the start and end parameters in the events
-        and segments, and so this segmentation can be reloaded using from_database.
+        and segments, and so this segmentation can be reloaded using from_database. The analysis is
+        written in a single transaction, with all events and all segments each inserted in bulk.
+        If host is None, database is the path of a local SQLite database, which is created if it
+        does not exist, instead of a MySQL database.
+
+        If packed is True, the segments of each event are instead stored as a single row of the
+        SegmentBlobs table, packed by pack_segments, which needs about a hundredth of the rows.
+        If pool_size is given, the pool of connections to the database keeps that many idle.
         '''
         
-        db = MySQLDatabaseInterface(db=database, host=host, password=password, user=user)
+        with connect(database, host=host, password=password, user=user, pool_size=pool_size) as db:
 
-        event_parser_name = self.event_parser.__class__.__name__
-        event_parser_params = repr( self.event_parser )
-        try:
-            state_parser_name = self.events[0].state_parser.__class__.__name__
-            state_parser_params = repr( self.events[0].state_parser )
-        except:
-            state_parser_name = "NULL"
-            state_parser_params = "NULL"
+            event_parser_name = self.event_parser.__class__.__name__
+            event_parser_params = repr( self.event_parser )
+            try:
+                state_parser_name = self.events[0].state_parser.__class__.__name__
+                state_parser_params = repr( self.events[0].state_parser )
+            except:
+                state_parser_name = "NULL"
+                state_parser_params = "NULL"
 
-        try:
-            filter_order = self.events[0].filter_order
-            filter_cutoff = self.events[0].filter_cutoff
-        except:
-            filter_order = "NULL"
-            filter_cutoff = "NULL"
-
-        metadata = "'{0}',NULL,NULL,'{1}','{2}','{3}','{4}', {5}, {6}".format( self.filename,
-                                                                     event_parser_name,
-                                                                     event_parser_params,
-                                                                     state_parser_name,
-                                                                     state_parser_params,
-                                                                     filter_order,
-                                                                     filter_cutoff
-                                                                    )
-        try:
-            prevAnalysisID = db.read( "SELECT ID FROM AnalysisMetadata \
-                                       WHERE Filename = '{0}' \
-                                           AND EventDetector = '{1}' \
-                                           AND segmenter = '{2}'".format( self.filename,
-                                                                            event_parser_name,
-                                                                            state_parser_name ) )[0][0]
-        except IndexError:
-            prevAnalysisID = None
-
-        if prevAnalysisID is not None:
-            prevAnalysisEventIDs = db.read( "SELECT ID FROM Events \
-                                 WHERE AnalysisID = {0}".format( prevAnalysisID ) )
-            for ID in prevAnalysisEventIDs:
-                ID = ID[0]
-                db.execute( "DELETE FROM Segments WHERE EventID = {0}".format( ID ) )
-                db.execute( "DELETE FROM Events WHERE ID = {0}".format( ID) )
-            db.execute( "DELETE FROM AnalysisMetadata WHERE ID = {0}".format( prevAnalysisID ) )
-
-        db.execute("INSERT INTO AnalysisMetadata VALUES({0})".format(metadata))
-        analysisID = db.read("SELECT ID FROM AnalysisMetadata ORDER BY Timestamp DESC")[0][0] 
-
-        for i, event in enumerate( self.events ):
-            values = "VALUES ({0},{1},{2},{3},{4},{5},NULL)".format( int(analysisID),
-                                                                     i,
-                                                                     event.start*100000,
-                                                                     event.end*100000,
-                                                                     event.mean,
-                                                                     event.std 
-                                                                    )
-            db.execute( "INSERT INTO Events " + values )
-
-            event_id = db.read( "SELECT ID FROM Events \
-                                 WHERE AnalysisID = '{0}' \
-                                 AND SerialID = {1}".format( analysisID,
-                                                             i 
-                                                            ) ) [-1][-1]
-
-            for j, seg in enumerate( event.segments ):
-                values = "VALUES ({0},{1},{2},{3},{4},{5})".format( int(event_id), 
-                                                                    j, 
-                                                                    seg.start*100000, 
-                                                                    seg.end*100000,
-                                                                    seg.mean,
-                                                                    seg.std,
-                                                                   ) 
-                db.execute( "INSERT INTO Segments " + values )
+            try:
+                filter_order = self.events[0].filter_order
+                filter_cutoff = self.events[0].filter_cutoff
+            except:
+                filter_order = "NULL"
+                filter_cutoff = "NULL"
+
+            metadata = "'{0}',NULL,NULL,'{1}','{2}','{3}','{4}', {5}, {6}".format( self.filename,
+                                                                         event_parser_name,
+                                                                         event_parser_params,
+                                                                         state_parser_name,
+                                                                         state_parser_params,
+                                                                         filter_order,
+                                                                         filter_cutoff
+                                                                        )
+            try:
+                prevAnalysisID = db.read( "SELECT ID FROM AnalysisMetadata \
+                                           WHERE Filename = '{0}' \
+                                               AND EventDetector = '{1}' \
+                                               AND segmenter = '{2}'".format( self.filename,
+                                                                                event_parser_name,
+                                                                                state_parser_name ) )[0][0]
+            except IndexError:
+                prevAnalysisID = None
+
+            events = EventTable.from_files( [ self ] )
+            segments = SegmentTable.from_files( [ self ] )
+
+            def column( values, scale=1 ):
+                # MySQL has no nan, so store missing values as NULL
+                return [ None if np.isnan( value ) else value for value in ( values*scale ).tolist() ]
+
+            # Write the whole analysis in one transaction, with one statement per table rather
+            # than one per event and segment.
+            with db.transaction():
+                if prevAnalysisID is not None:
+                    db.execute( "DELETE FROM Segments WHERE EventID IN \
+                                 (SELECT ID FROM Events WHERE AnalysisID = %s)", ( prevAnalysisID, ) )
+                    # Databases made before segments could be packed have no SegmentBlobs table.
+                    with ignored( DatabaseError ):
+                        db.execute( "DELETE FROM SegmentBlobs WHERE EventID IN \
+                                     (SELECT ID FROM Events WHERE AnalysisID = %s)", ( prevAnalysisID, ) )
+                    db.execute( "DELETE FROM Events WHERE AnalysisID = %s", ( prevAnalysisID, ) )
+                    db.execute( "DELETE FROM AnalysisMetadata WHERE ID = %s", ( prevAnalysisID, ) )
+
+                db.execute( "INSERT INTO AnalysisMetadata VALUES({0})".format( metadata ) )
+                analysisID = int( db.lastrowid )
+
+                db.executemany( "INSERT INTO Events VALUES (%s,%s,%s,%s,%s,%s,NULL)",
+                    list( zip( [ analysisID ] * len( events ), range( len( events ) ),
+                               column( events.start, 100000 ), column( events.end, 100000 ),
+                               column( events.mean ), column( events.std ) ) ) )
+
+                # Recover the IDs of all of the events at once, in the order they were written.
+                event_ids = dict( db.read( "SELECT SerialID, ID FROM Events \
+                                            WHERE AnalysisID = {0}".format( analysisID ) ) )
+                _, event_idx, starts, ends = segments.event_bounds()
+
+                if packed:
+                    start, end = np.rint( segments.start*100000 ), np.rint( segments.end*100000 )
+                    db.executemany( "INSERT INTO SegmentBlobs VALUES (%s,%s)",
+                        [ ( int( event_ids[i] ), pack_segments( start[low:high], end[low:high],
+                            segments.mean[low:high], segments.std[low:high] ) )
+                          for i, low, high in zip( event_idx.tolist(), starts, ends ) ] )
+                else:
+                    segment_event_ids = [ int( event_ids[i] ) for i in segments.event.tolist() ]
+                    serial_ids = np.arange( len( segments ) ) - np.repeat( starts, ends - starts )
+
+                    db.executemany( "INSERT INTO Segments VALUES (%s,%s,%s,%s,%s,%s)",
+                        list( zip( segment_event_ids, serial_ids.tolist(),
+                                   column( segments.start, 100000 ), column( segments.end, 100000 ),
+                                   column( segments.mean ), column( segments.std ) ) ) )
 
     @property
     def n( self ):
         return len( self.events )
 
 
+_worker_params = None
+
+def _init_worker( *params ):
+    '''
+    Store the parameters of parsing in each worker process of Experiment.parse, so that
+    they are inherited rather than sent along with each file.
+    '''
+
+    global _worker_params
+    _worker_params = params
+
+def _parse_file( filename ):
+    '''
+    Read, detect, filter, and segment one file in a worker process of Experiment.parse,
+    returning the header and tables of its events and segments rather than the file, so
+    that the currents are not sent back to the main process.
+    '''
+
+    event_detector, segmenter, filter_params, cache = _worker_params
+
+    file = File( filename )
+    file.parse( parser=event_detector, cache=cache )
+    if filter_params is not None:
+        file.filter( *filter_params )
+    if segmenter is not None:
+        for event in file.events:
+            event.parse( parser=segmenter, cache=cache )
+
+    return file._header(), EventTable.from_files( [ file ] ), SegmentTable.from_files( [ file ] )
+
 class Experiment( object ):
     '''
     An experiment represents a series of files which all are to be analyzed together, and have
@@ -953,41 +1490,94 @@ class Experiment( object ):
         self.filenames = filenames
         self.name = name or "Experiment"
         self.files = []
+        self._tables = None
 
     def parse( self, event_detector=lambda_event_parser( threshold=90 ), 
         segmenter=SpeedyStatSplit( prior_segments_per_second=10, cutoff_freq=2000. ),
         filter_params=(1,2000),
-        verbose=True, meta=False  ):
+        verbose=True, meta=False, cache=None, writer=None, n_jobs=1 ):
         '''
         Go through each of the files and parse them appropriately. If the segmenter
         is set to None, then do not segment the events. If you want to filter the
-        events, pass in filter params of (order, cutoff), otherwise None.
+        events, pass in filter params of (order, cutoff), otherwise None. If an
+        AnalysisCache is given, events and segments are loaded from it when possible.
+        If a DatabaseWriter is given, each file is submitted to it once parsed, and
+        written to the database while the next file is parsed.
+
+        If n_jobs is more than 1, files are parsed in that many worker processes, which
+        only send back the metadata of the events and segments, so the files are always
+        stored as metafiles, as if meta were True. The files are still stored in the
+        order of the filenames. Workers are forked, inheriting the parsers, so this is
+        not available on Windows.
         '''
 
+        self._tables = None
+
+        if n_jobs > 1:
+            self._parse_parallel( event_detector, segmenter, filter_params, verbose, cache,
+                writer, n_jobs )
+            return
+
         # Go through each file one at a time as a generator to ensure many files
         # are not open at the same time.
-        for file in it.imap( File, self.filenames ):
+        for file in ( File( filename ) for filename in self.filenames ):
             if verbose:
                 print("Opening {}".format( file.filename ))
 
-            file.parse( parser=event_detector )
+            file.parse( parser=event_detector, cache=cache )
 
             if verbose:
                 print("\tDetected {} Events".format( file.n ))
+
+            # Filter the whole file once, which the events are views of
+            if filter_params is not None:
+                file.filter( *filter_params )
             
             # If using a segmenter, then segment all of the events in this file
             for i, event in enumerate( file.events ):
-                if filter_params is not None:
-                    event.filter( *filter_params )
                 if segmenter is not None:
-                    event.parse( parser=segmenter )
+                    event.parse( parser=segmenter, cache=cache )
                     if verbose:
                         print("\t\tEvent {} has {} segments".format( i+1, event.n ))
 
             if meta:
                 file.to_meta()
+            if writer is not None:
+                writer.submit( file )
             self.files.append( file )
 
+        if writer is not None:
+            writer.flush()
+
+    def _parse_parallel( self, event_detector, segmenter, filter_params, verbose, cache,
+        writer, n_jobs ):
+        '''
+        Parse the files in a pool of n_jobs worker processes, rebuilding each file from
+        the tables of metadata its worker returns, in the order of the filenames.
+        '''
+
+        import multiprocessing
+
+        pool = multiprocessing.get_context( 'fork' ).Pool( n_jobs, initializer=_init_worker,
+            initargs=( event_detector, segmenter, filter_params, cache ) )
+
+        try:
+            for header, events, segments in pool.imap( _parse_file, self.filenames ):
+                file = File._from_tables( header, events, segments )
+                if verbose:
+                    print("Parsed {}: {} Events, {} Segments".format( file.filename,
+                        len( events ), len( segments ) ))
+
+                if writer is not None:
+                    writer.submit( file )
+                self.files.append( file )
+        finally:
+            pool.terminate()
+            pool.join()
+
+        if writer is not None:
+            writer.flush()
+
     def apply_hmm( self, hmm, filter=None, indices=None ):
         segments = []
         for event in self.get( "events", filter=filter, indices=indices ):
@@ -1002,6 +1592,7 @@ class Experiment( object ):
         with ignored( AttributeError ):
             del self.segments
 
+        self._tables = None
         for file in self.files:
             file.delete()
         del self
@@ -1016,21 +1607,44 @@ class Experiment( object ):
         Return all the events in all files.
         '''
         
-        try:
-            return reduce( list.__add__, [ file.events for file in self.files ] )
-        except:
-            return []
+        return list( it.chain.from_iterable( getattr( file, 'events', [] ) for file in self.files ) )
 
     @property
     def segments( self ):
         '''
-        Return all segments from all events in an unordered manner.
+        Return all segments from all events, in order.
         '''
 
-        try:
-            return reduce( list.__add__, [ event.segments for event in self.events ] )
-        except:
-            return []
+        return list( it.chain.from_iterable( getattr( event, 'segments', [] ) for event in self.events ) )
+
+    def _build_tables( self ):
+        '''
+        Build the columnar event and segment tables of all files, unless they have
+        already been built since the last parse.
+        '''
+
+        if getattr( self, '_tables', None ) is None:
+            self._tables = ( EventTable.from_files( self.files ), SegmentTable.from_files( self.files ) )
+        return self._tables
+
+    @property
+    def event_table( self ):
+        '''
+        Return an EventTable of the metadata of every event in the experiment, with the
+        index of the file each is in. Built once, and then cached until the next parse.
+        '''
+
+        return self._build_tables()[0]
+
+    @property
+    def segment_table( self ):
+        '''
+        Return a SegmentTable of the metadata of every segment in the experiment, with the
+        index of the file and event each is in. Built once, and then cached until the next
+        parse.
+        '''
+
+        return self._build_tables()[1]
  
 class Sample( object ):
     '''A container for events all suggested to be from the same substrate.'''
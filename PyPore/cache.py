@@ -0,0 +1,222 @@
+# cache.py
+# Contact: Jacob Schreiber
+#          jmschreiber91@gmail.com
+
+'''
+This module contains a local on-disk cache of analyses. Each entry holds the start
+and end of every segment which a parser found in some ionic current, keyed by a hash
+of the current itself and the parameters of the parser, so that running the same
+parser on the same data again loads the split points instead of recomputing them. See
+following:
+
+cache = AnalysisCache()
+file = File( "my_data.abf" )
+file.parse( parser=lambda_event_parser(), cache=cache )
+file.filter( order=1, cutoff=2000 )
+for event in file.events:
+    event.parse( parser=SpeedyStatSplit(), cache=cache )
+
+Since the key is a hash of the current, events which were filtered differently have
+different keys. Parameters which are not reported by parser.to_dict, such as the rules
+of a lambda_event_parser, are part of the key through the bytecode, constants, and
+the closed over and global values of each function. A parser holding anything which cannot be described
+this way is not cached, and is simply run each time.
+'''
+
+import os
+import json
+import hashlib
+import types
+import numpy as np
+
+from .core import ignored
+from .parsers import MemoryParse
+
+def describe( value, seen=() ):
+	'''
+	Return a description of a value which can be dumped to json, and which is the same for
+	any two values which behave the same, in order to key parsers by their full state.
+	Functions are described by their bytecode, constants, defaults, and the values they
+	close over or read from their globals. Raise a ValueError if the value cannot be described, such as an object
+	whose repr only gives its address.
+	'''
+
+	if id( value ) in seen:
+		return '<cycle>'
+	seen = seen + ( id( value ), )
+
+	if value is None or isinstance( value, ( bool, int, float, str, bytes ) ):
+		return repr( value )
+	if isinstance( value, ( list, tuple ) ):
+		return [ describe( item, seen ) for item in value ]
+	if isinstance( value, dict ):
+		return sorted( [ repr( key ), describe( item, seen ) ] for key, item in value.items() )
+	if isinstance( value, np.ndarray ):
+		return current_digest( value )
+	if isinstance( value, types.CodeType ):
+		return [ value.co_code.hex(), list( value.co_names ),
+			[ describe( const, seen ) for const in value.co_consts ] ]
+	if isinstance( value, types.FunctionType ):
+		closure = [ cell.cell_contents for cell in value.__closure__ or () ]
+		global_values = { name: value.__globals__[ name ] for name in _code_names( value.__code__ )
+			if name in value.__globals__ }
+		return [ 'function', describe( value.__code__, seen ),
+			describe( value.__defaults__, seen ), describe( closure, seen ),
+			describe( global_values, seen ) ]
+	if isinstance( value, types.MethodType ):
+		return [ 'method', describe( value.__func__, seen ), describe( value.__self__, seen ) ]
+
+	description = repr( value )
+	if ' at 0x' in description:
+		raise ValueError( "Cannot describe {} for a cache key.".format( description ) )
+	return description
+
+def _code_names( code ):
+	'''
+	Return the names used by a code object and any code objects nested in it, which
+	includes every global it reads.
+	'''
+
+	names = set( code.co_names )
+	for const in code.co_consts:
+		if isinstance( const, types.CodeType ):
+			names |= _code_names( const )
+	return names
+
+def current_digest( current ):
+	'''
+	Return a hex digest of the contents of an array of ionic current.
+	'''
+
+	current = np.ascontiguousarray( current )
+	digest = hashlib.sha1( str( current.dtype ).encode( 'utf-8' ) )
+	digest.update( memoryview( current.view( np.uint8 ) ) )
+	return digest.hexdigest()
+
+class AnalysisCache( object ):
+	'''
+	A directory of cached split points, one .npz file per entry. When the total size of
+	the entries grows beyond max_size bytes, the least recently used entries are evicted,
+	using the modification time of each file, which is updated whenever it is read.
+	'''
+
+	def __init__( self, directory=None, max_size=2**30 ):
+		self.directory = directory or os.path.join( os.path.expanduser( '~' ), '.pypore', 'cache' )
+		self.max_size = max_size
+		self._size = None
+
+		if not os.path.isdir( self.directory ):
+			os.makedirs( self.directory )
+
+	def key( self, current, parser, **params ):
+		'''
+		Return the key of running the parser on the current, combining a hash of the current
+		with the parameters of the parser, and any other parameters given. Raise a ValueError
+		if the state of the parser cannot be described.
+		'''
+
+		try:
+			parser_params = parser.to_dict()
+		except AttributeError:
+			parser_params = { 'name' : parser.__class__.__name__ }
+
+		# to_dict leaves out functions, such as rules, so describe the full state of the parser.
+		state = describe( getattr( parser, '__dict__', {} ), ( id( parser ), ) )
+
+		description = json.dumps( [ parser_params, state, params ], sort_keys=True, default=repr )
+		digest = hashlib.sha1( current_digest( current ).encode( 'utf-8' ) )
+		digest.update( description.encode( 'utf-8' ) )
+		return digest.hexdigest()
+
+	def _path( self, key ):
+		return os.path.join( self.directory, key + '.npz' )
+
+	def get( self, key ):
+		'''
+		Return the starts and ends stored under the key, or None if there is no such entry.
+		'''
+
+		path = self._path( key )
+		try:
+			with np.load( path ) as entry:
+				starts, ends = entry['starts'], entry['ends']
+		except ( IOError, OSError, KeyError, ValueError ):
+			return None
+
+		# Mark the entry as recently used.
+		with ignored( OSError ):
+			os.utime( path, None )
+		return starts, ends
+
+	def put( self, key, starts, ends ):
+		'''
+		Store the starts and ends under the key, then evict the least recently used entries
+		until the cache fits in max_size bytes.
+		'''
+
+		path = self._path( key )
+		temp = path + '.tmp.npz'
+		np.savez( temp, starts=np.asarray( starts, dtype=np.int64 ),
+			ends=np.asarray( ends, dtype=np.int64 ) )
+		os.rename( temp, path )
+
+		# Only scan the directory when the entries written may have filled the cache.
+		if self._size is not None:
+			self._size += os.path.getsize( path )
+		if self._size is None or self._size > self.max_size:
+			self.evict()
+
+	def evict( self ):
+		'''
+		Remove the least recently used entries until the cache fits in max_size bytes.
+		'''
+
+		entries = []
+		for name in os.listdir( self.directory ):
+			if not name.endswith( '.npz' ) or name.endswith( '.tmp.npz' ):
+				continue
+			with ignored( OSError ):
+				stat = os.stat( os.path.join( self.directory, name ) )
+				entries.append( ( stat.st_mtime, stat.st_size, name ) )
+
+		total = sum( size for _, size, _ in entries )
+		for _, size, name in sorted( entries ):
+			if total <= self.max_size:
+				break
+			with ignored( OSError ):
+				os.remove( os.path.join( self.directory, name ) )
+			total -= size
+
+		self._size = total
+
+	def clear( self ):
+		'''
+		Remove every entry from the cache.
+		'''
+
+		for name in os.listdir( self.directory ):
+			if name.endswith( '.npz' ):
+				with ignored( OSError ):
+					os.remove( os.path.join( self.directory, name ) )
+		self._size = 0
+
+	def parse( self, current, parser, **params ):
+		'''
+		Return the segments of the current found by the parser, loading the split points from
+		the cache if this parser has been run on this current before, and storing them if not.
+		'''
+
+		try:
+			key = self.key( current, parser, **params )
+		except ValueError:
+			return parser.parse( current )
+
+		bounds = self.get( key )
+		if bounds is not None:
+			starts, ends = bounds
+			return MemoryParse( starts.tolist(), ends.tolist(), copy=False ).parse( current )
+
+		segments = parser.parse( current )
+		self.put( key, [ seg.start for seg in segments ],
+			[ seg.start + len( seg.current ) for seg in segments ] )
+		return segments
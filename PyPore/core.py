@@ -11,25 +11,44 @@ import re
 import json
 from contextlib import contextmanager
 
-class MetaSegment( object ):
+import pyximport
+pyximport.install( setup_args={'include_dirs':np.get_include()} )
+from PyPore.cstats import moments, slice_moments, view_offsets
+
+class SegmentBase( object ):
+	'''
+	The compact storage shared by segments and metasegments. The core metadata of a segment
+	is stored in slots rather than a per-instance dict, as an experiment may hold tens of
+	millions of segments. Any other attribute, such as those passed in as keyword arguments,
+	is stored in a side dict which is only created the first time one is set. Since segments
+	and metasegments share this layout, a segment is converted to a metasegment in place by
+	swapping its class.
+	'''
+
+	__slots__ = ( 'start', 'end', 'duration', 'mean', 'std', 'min', 'max', 'n', 'event',
+		'_current', '_stats', '__dict__' )
+
+class MetaSegment( SegmentBase ):
 	'''
 	The metadata on an abstract segment of ionic current. All information about a segment can be 
 	loaded, without the expectation of the array of floats.
 	'''
+
+	__slots__ = ()
+
 	def __init__( self, **kwargs ):
+		# If current is passed in, get metadata directly from it, without storing
+		# a reference to that array.
+		current = kwargs.pop( 'current', None )
+
 		for key, value in kwargs.items():
-			with ignored( AttributeError ):
+			try:
 				setattr( self, key, value )
+			except AttributeError:
+				pass
 
-		# If current is passed in, get metadata directly from it, then remove
-		# the reference to that array.
-		if hasattr( self, "current" ):
-			self.n = len( self.current )
-			self.mean = np.mean( self.current )
-			self.std = np.std( self.current )
-			self.min = np.min( self.current )
-			self.max = np.max( self.current )
-			del self.current
+		if current is not None:
+			self.n, self.mean, self.std, self.min, self.max = summarize( current )
 
 		# Fill in start, end, and duration given that you only have two of them.
 		if hasattr( self, "start" ) and hasattr( self, "end" ) and not hasattr(self, "duration" ):
@@ -112,13 +131,17 @@ class MetaSegment( object ):
 
 		return MetaSegment( **attrs )
 
-class Segment( object ):
+class Segment( SegmentBase ):
 	'''
 	A segment of ionic current, and methods relevant for collecting metadata. The ionic current is
 	expected to be passed as a numpy array of floats. Metadata methods (mean, std..) are decorated 
 	as properties to reduce overall computational time, making them calculated on the fly rather 
-	than during analysis.
+	than during analysis. They are all calculated together on first access and cached, until the
+	current is reassigned.
 	'''
+
+	__slots__ = ()
+
 	def __init__( self, current, **kwargs ):
 		'''
 		The segment must have a list of ionic current, of which it stores some statistics about. 
@@ -130,8 +153,10 @@ class Segment( object ):
 		for key, value in kwargs.items():
 			if hasattr( self, key ):
 				continue
-			with ignored( AttributeError ):
+			try:
 				setattr( self, key, value )
+			except AttributeError:
+				pass
 
 	def __repr__( self ):
 		'''
@@ -178,12 +203,15 @@ class Segment( object ):
 		about the segment and not the full array of ionic current.
 		'''
 
-		for key in ['mean', 'std', 'min', 'max', 'end', 'start', 'duration']:
-			with ignored( KeyError, AttributeError ):
-				self.__dict__[ key ] = getattr( self, key )
-		del self.current 
+		try:
+			stats = self._summary()
+			del self._current, self._stats
+		except AttributeError:
+			stats = None
 
-		self.__class__  = type( "MetaSegment", ( MetaSegment, ), self.__dict__ )
+		self.__class__ = MetaSegment
+		if stats is not None:
+			self.n, self.mean, self.std, self.min, self.max = stats
 
 	def delete( self ):
 		'''
@@ -201,23 +229,46 @@ class Segment( object ):
 		Rescale all of the values to go from samples to seconds.
 		'''
 
-		with ignored( AttributeError ):
-			self.start /= sampling_freq
-			self.end /= sampling_freq
-			self.duration /= sampling_freq
+		for key in ( 'start', 'end', 'duration' ):
+			try:
+				setattr( self, key, getattr( self, key ) / sampling_freq )
+			except AttributeError:
+				pass
+
+	@property
+	def current( self ):
+		return self._current
+	@current.setter
+	def current( self, current ):
+		self._current = current
+		self._stats = None
+	@current.deleter
+	def current( self ):
+		del self._current
+		self._stats = None
+
+	def _summary( self ):
+		'''
+		Return the cached ( n, mean, std, min, max ) of the current, calculating
+		them first if the current has changed since they were last calculated.
+		'''
+
+		if getattr( self, '_stats', None ) is None:
+			self._stats = summarize( self.current )
+		return self._stats
 
 	@property
 	def mean( self ):
-		return np.mean( self.current )
+		return self._summary()[1]
 	@property
 	def std( self ):
-		return np.std( self.current )
+		return self._summary()[2]
 	@property
 	def min( self ):
-		return np.min( self.current )
+		return self._summary()[3]
 	@property
 	def max( self ):
-		return np.max( self.current )
+		return self._summary()[4]
 	@property
 	def n( self ):
 		return len( self.current )
@@ -248,6 +299,69 @@ class Segment( object ):
 		
 		return Segment( current, **attrs )
 
+def summarize( current ):
+	'''
+	Return the ( n, mean, std, min, max ) of an array of ionic current, calculated in a
+	single pass over the current by the cstats kernel instead of a numpy pass for each.
+	An empty array has no statistics, so they are nan.
+	'''
+
+	n, total, squares, minimum, maximum = moments( current )
+	if n == 0:
+		return 0, np.nan, np.nan, np.nan, np.nan
+
+	mean = total / n
+	std = np.sqrt( max( squares / n - mean*mean, 0. ) )
+	return n, mean, std, minimum, maximum
+
+def summarize_slices( current, starts, ends ):
+	'''
+	Return a tuple of arrays of ( n, mean, std, min, max ), one value for each slice
+	current[start:end] given by the pairs of starts and ends, calculated in a single
+	pass over the slices of the current by the cstats kernel. Empty slices have no
+	statistics, so they are nan.
+	'''
+
+	n, total, squares, minimum, maximum = slice_moments( current, starts, ends )
+	with np.errstate( divide='ignore', invalid='ignore' ):
+		mean = total / n
+		std = np.sqrt( np.maximum( squares / n - mean*mean, 0. ) )
+	return n, mean, std, minimum, maximum
+
+def summarize_views( current, segments ):
+	'''
+	Calculate the statistics of every segment which is a view of the current in a single
+	pass over the current, and cache them in each segment, instead of having each segment
+	calculate its own separately. Segments whose statistics are already cached are skipped,
+	and if any of the rest is not a view of the current, they are all left to calculate
+	their own statistics when first asked.
+	'''
+
+	segments = [ seg for seg in segments if isinstance( seg, Segment ) and
+		getattr( seg, '_stats', None ) is None and hasattr( seg, '_current' ) ]
+	if len( segments ) == 0:
+		return
+
+	bounds = view_bounds( current, [ seg.current for seg in segments ] )
+	if bounds is None:
+		return
+
+	for segment, stats in zip( segments, zip( *summarize_slices( current, *bounds ) ) ):
+		segment._stats = stats
+
+def view_bounds( current, views ):
+	'''
+	Return arrays of the start and end index into the current of each of the views,
+	found from where their memory lies, or None if any of them is not a contiguous
+	view of the current.
+	'''
+
+	if not isinstance( current, np.ndarray ) or current.ndim != 1 or \
+		current.strides[0] != current.itemsize:
+		return None
+
+	return view_offsets( current, list( views ) )
+
 @contextmanager
 def ignored( *exceptions ):
 	'''
@@ -0,0 +1,156 @@
+# cstats.pyx
+# Contact: Jacob Schreiber
+#          jmschreiber91@gmail.com
+
+'''
+This contains cython kernels for the statistics of ionic current. The n, sum,
+sum of squares, min, and max of the current are calculated together in a single
+pass over memory, instead of making a separate numpy pass for each statistic.
+This can be done either for a whole array, or for many slices of a parent array
+given their start and end indices. See core.py summarize and summarize_slices
+for the mean and standard deviation. The start and end indices of slices which
+are views of a parent array can be found from where their memory lies.
+'''
+
+import numpy as np
+cimport numpy as np
+cimport cython
+
+np.import_array()
+
+ctypedef fused current_t:
+	float
+	double
+
+def _as_current( current ):
+	'''
+	Return the current as a float32 or float64 array, only copying it if it is
+	neither.
+	'''
+
+	current = np.asarray( current )
+	if current.dtype != np.float32 and current.dtype != np.float64:
+		current = current.astype( np.float64 )
+	return current
+
+def moments( current ):
+	'''
+	Return a tuple of ( n, sum, sum of squares, min, max ) of the current. The
+	min and max of an empty array are nan.
+	'''
+
+	current = _as_current( current )
+	if current.shape[0] == 0:
+		return 0, 0., 0., np.nan, np.nan
+	return _moments( current )
+
+def slice_moments( current, starts, ends ):
+	'''
+	Return a tuple of arrays of ( n, sum, sum of squares, min, max ), one value
+	for each slice current[start:end] given by the pairs of starts and ends. The
+	min and max of empty slices are nan.
+	'''
+
+	current = _as_current( current )
+	starts = np.asarray( starts, dtype=np.int64 )
+	ends = np.asarray( ends, dtype=np.int64 )
+
+	if starts.shape[0] != ends.shape[0]:
+		raise ValueError( "Must provide the same number of starts and ends." )
+	if starts.shape[0] > 0 and ( starts.min() < 0 or ends.max() > current.shape[0] ):
+		raise IndexError( "Slices must lie within the current." )
+
+	out = np.empty( ( 5, starts.shape[0] ) )
+	if starts.shape[0] > 0:
+		_slice_moments( current, starts, ends, out )
+	return out[0].astype( np.int64 ), out[1], out[2], out[3], out[4]
+
+def view_offsets( np.ndarray current, views ):
+	'''
+	Return arrays of the start and end index into the current of each of the views,
+	found from where their memory lies, or None if any of them is not a contiguous
+	view of the current. The current must be one dimensional and contiguous.
+	'''
+
+	cdef np.ndarray view
+	cdef Py_ssize_t i, n = len( views )
+	cdef Py_ssize_t itemsize = np.PyArray_ITEMSIZE( current ), size = np.PyArray_DIM( current, 0 )
+	cdef Py_ssize_t offset, length
+	cdef char* address = <char*> np.PyArray_DATA( current )
+	cdef int typenum = np.PyArray_TYPE( current )
+
+	starts = np.empty( n, dtype=np.int64 )
+	ends = np.empty( n, dtype=np.int64 )
+	cdef np.int64_t [:] _starts = starts, _ends = ends
+
+	for i in range( n ):
+		if not isinstance( views[i], np.ndarray ):
+			return None
+
+		view = views[i]
+		if np.PyArray_NDIM( view ) != 1 or np.PyArray_TYPE( view ) != typenum:
+			return None
+
+		length = np.PyArray_DIM( view, 0 )
+		if length > 1 and np.PyArray_STRIDE( view, 0 ) != itemsize:
+			return None
+
+		offset = <char*> np.PyArray_DATA( view ) - address
+		if offset % itemsize != 0:
+			return None
+
+		offset //= itemsize
+		if offset < 0 or offset + length > size:
+			return None
+
+		_starts[i] = offset
+		_ends[i] = offset + length
+
+	return starts, ends
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _moments( const current_t [:] current ):
+	cdef Py_ssize_t i, n = current.shape[0]
+	cdef double x, total = 0, squares = 0
+	cdef double minimum = current[0], maximum = current[0]
+
+	for i in range( n ):
+		x = current[i]
+		total += x
+		squares += x*x
+		if x < minimum:
+			minimum = x
+		if x > maximum:
+			maximum = x
+
+	return n, total, squares, minimum, maximum
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _slice_moments( const current_t [:] current, const np.int64_t [:] starts,
+	const np.int64_t [:] ends, double [:, :] out ):
+	cdef Py_ssize_t i, j
+	cdef double x, total, squares, minimum, maximum
+	cdef double nan = np.nan
+
+	for j in range( starts.shape[0] ):
+		total, squares = 0, 0
+		minimum, maximum = nan, nan
+		if ends[j] > starts[j]:
+			minimum = maximum = current[ starts[j] ]
+
+		for i in range( starts[j], ends[j] ):
+			x = current[i]
+			total += x
+			squares += x*x
+			if x < minimum:
+				minimum = x
+			if x > maximum:
+				maximum = x
+
+		out[0, j] = ends[j] - starts[j] if ends[j] > starts[j] else 0
+		out[1, j] = total
+		out[2, j] = squares
+		out[3, j] = minimum
+		out[4, j] = maximum
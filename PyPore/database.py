@@ -55,35 +55,251 @@ table. Assuming that the previous commands did not occur, you can do the followi
 >>> table.read()
 (( 'cheddar', 'CHE' ), ( 'american', 'AME', ), ( 'gruye', 'GRU' ),
     ('mozarella', 'MOZ'))
+
+Connections are drawn from a pool for each server, database, and user, so opening
+many Database objects one after another only connects to the server once. Close a
+Database to return its connection to the pool, or use it in a with statement.
+
+>>> with Database( db="cheeses", user="jim", password="1hGaj29Kajh", 
+        host="127.0.0.1" ) as db:
+...     db.execute( "SELECT * FROM cheese_list" )
 '''
 
-import MySQLdb
+import os
+import numpy as np
 import itertools as it
+import threading
+import time
+import sqlite3
+from contextlib import contextmanager
+
+try:
+    import MySQLdb
+    import MySQLdb.cursors
+except ImportError:
+    MySQLdb = None
+
+try:
+    from itertools import zip_longest
+except ImportError:
+    from itertools import izip_longest as zip_longest
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+class ConnectionPool( object ):
+    '''
+    A pool of connections to a database, made by calling connect. Up to size idle
+    connections are kept open to be reused. A connection which has been idle for more
+    than check_interval seconds is pinged before being handed out, and if it has been
+    dropped by the server, a new connection is made in its place. Connections are
+    rolled back as they are released, ending any transaction left open by reads.
+    '''
+
+    def __init__( self, connect, size=4, check_interval=30. ):
+        self.connect = connect
+        self.size = size
+        self.check_interval = check_interval
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire( self ):
+        '''
+        Return an open connection, reusing an idle one if there is a healthy one.
+        '''
+
+        while True:
+            with self._lock:
+                if len( self._idle ) == 0:
+                    break
+                connection, released = self._idle.pop()
+
+            if time.time() - released < self.check_interval or self._healthy( connection ):
+                return connection
+            self._close( connection )
+
+        return self.connect()
+
+    def release( self, connection ):
+        '''
+        Return a connection to the pool, closing it if the pool is already full. Any open
+        transaction is rolled back first, so that the next user of the connection does not
+        inherit uncommitted changes, or a snapshot of the database taken by earlier reads
+        which would hide anything written since.
+        '''
+
+        try:
+            connection.rollback()
+        except Exception:
+            self._close( connection )
+            return
+
+        with self._lock:
+            if len( self._idle ) < self.size:
+                self._idle.append( ( connection, time.time() ) )
+                return
+        self._close( connection )
+
+    @contextmanager
+    def connection( self ):
+        '''
+        Use a connection from the pool inside a with statement, then return it.
+        '''
+
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release( connection )
+
+    def close( self ):
+        '''
+        Close all idle connections.
+        '''
+
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close( connection )
+
+    @staticmethod
+    def _healthy( connection ):
+        # Connections to local files, such as SQLite, cannot be dropped and have no ping.
+        if not hasattr( connection, 'ping' ):
+            return True
+        try:
+            connection.ping()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close( connection ):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _mysql_connect( host, user, password, db ):
+    if MySQLdb is None:
+        raise DatabaseError( "MySQLdb must be installed to connect to a MySQL server." )
+    return MySQLdb.connect( host, user, password, db )
+
+def get_pool( host, user, password, db, size=None, connect=None ):
+    '''
+    Return the connection pool for a database on a server, creating it the first time.
+    Connections are made by calling connect, defaulting to connecting to a MySQL server.
+    If size is given, it becomes the number of idle connections the pool keeps, even if
+    the pool already exists; otherwise a new pool keeps 4.
+    '''
+
+    key = ( host, user, password, db )
+    with _pools_lock:
+        if key not in _pools:
+            connect = connect or ( lambda: _mysql_connect( host, user, password, db ) )
+            _pools[ key ] = ConnectionPool( connect, size=size or 4 )
+        elif size is not None:
+            _pools[ key ].size = size
+        return _pools[ key ]
 
 class Database( object ):
     '''
-    Represents a SQL database. 
+    Represents a SQL database. The columns of each table are cached the first time they are
+    needed, as are the statements which tables build, so that repeated reads and inserts do
+    not query the schema again. If a table is altered through some other connection, call
+    invalidate to drop what is cached about it.
     '''
 
-    def __init__( self, db, user, password, host ):
+    def __init__( self, db, user, password, host, pool_size=None ):
         '''
         Take in the credentials for the server and connect to it, connecting
-        to a specific database on the server.
+        to a specific database on the server. The connection is drawn from the
+        pool for that database, which keeps pool_size idle connections if given.
         '''
 
-        self.db = MySQLdb.connect( host, user, password, db )
+        self.pool = get_pool( host, user, password, db, size=pool_size )
+        self.db = self.pool.acquire()
         self.cursor = self.db.cursor()
+        self.schemas = {}
+        self.statements = {}
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, exc_type, exc_value, traceback ):
+        self.close()
 
-    def execute( self, statement ):
+    def close( self ):
         '''
-        Allows the user to execute a specific SQL command. If an error is
-        raised, raise an error.
+        Return the connection to the pool.
         '''
 
-        self.cursor.execute( statement )
+        if self.db is not None:
+            try:
+                self.cursor.close()
+            except Exception:
+                pass
+            self.pool.release( self.db )
+            self.db, self.cursor = None, None
+
+    def execute( self, statement, args=None ):
+        '''
+        Allows the user to execute a specific SQL command, with args filling in any %s
+        placeholders in it. If an error is raised, raise an error. Statements which
+        change the schema of the database drop everything cached about it.
+        '''
+
+        if statement.lstrip().upper().startswith( ( 'ALTER', 'CREATE', 'DROP', 'RENAME' ) ):
+            self.invalidate()
+
+        if args is None:
+            self.cursor.execute( statement )
+        else:
+            self.cursor.execute( statement, args )
         self.db.commit()
         return self.cursor.fetchall()
 
+    def schema( self, table ):
+        '''
+        Return the columns of a table as reported by SHOW COLUMNS, querying the
+        database only the first time.
+        '''
+
+        if table not in self.schemas:
+            self.schemas[ table ] = self.execute( "SHOW COLUMNS FROM {}".format( table ) )
+        return self.schemas[ table ]
+
+    def statement( self, table, key, build ):
+        '''
+        Return the statement on a table cached under the key, calling build to make it
+        the first time.
+        '''
+
+        key = ( table, ) + key
+        if key not in self.statements:
+            self.statements[ key ] = build()
+        return self.statements[ key ]
+
+    def invalidate( self, table=None ):
+        '''
+        Drop the cached columns and statements of a table, or of every table if none
+        is given, so that they are read again from the database when next needed.
+        '''
+
+        if table is None:
+            self.schemas.clear()
+            self.statements.clear()
+            return
+
+        self.schemas.pop( table, None )
+        for key in [ key for key in self.statements if key[0] == table ]:
+            del self.statements[ key ]
+
     def get_table( self, table ):
         '''
         Make a table object for a certain table.
@@ -103,7 +319,10 @@ class Database( object ):
 class Table( object ):
     '''
     Represents a table in the database. Allows you to query that table directly
-    instead of looking at the database level.
+    instead of looking at the database level. The columns of the table and the
+    statements built to read and insert into it are cached by the database, and
+    values are passed to the database as arguments rather than formatted into the
+    statements.
     '''
 
     def __init__( self, db, name ):
@@ -116,11 +335,11 @@ class Table( object ):
 
     @property
     def columns( self ):
-        return self.db.execute( "SHOW COLUMNS FROM {}".format( self.name ) )
+        return self.db.schema( self.name )
 
     @property
     def column_type_dict( self ):
-        return { key: value for key, value, _, _, _, _ in self.columns }
+        return { column[0]: column[1] for column in self.columns }
 
     @property
     def column_names( self ):
@@ -132,15 +351,23 @@ class Table( object ):
 
     def read( self, columns=None, values=None ):
         '''
-        Read certain columns from the table, or all by default.
+        Read certain columns from the table, or all by default. The statement is cached
+        by the columns read and the shape of the clauses, so it is only formatted the
+        first time that shape is read.
         '''
 
-        query = "SELECT {} FROM {}".format( 
-            ','.join( columns ) if columns else '*', self.name )
-        if values:
-            query += " WHERE {}".format( self._build_clauses( values, columns ) )
+        shape, args = self._clause_shape( values, columns ) if values else ( (), () )
+        columns = tuple( columns or () )
+
+        def build():
+            query = "SELECT {} FROM {}".format( ','.join( columns ) or '*', self.name )
+            clauses = self._format_clauses( shape )
+            if clauses:
+                query += " WHERE {}".format( clauses )
+            return query
 
-        return self.db.execute( query )
+        query = self.db.statement( self.name, ( 'read', columns, shape ), build )
+        return self.db.execute( query, args or None )
 
     def insert( self, values, columns=None ):
         '''
@@ -149,23 +376,41 @@ class Table( object ):
         use that ordering.
         '''
 
-        self.db.execute( "INSERT INTO {} {} VALUES ({})".format(
-            self.name, "({})".format( ','.join( columns ) ) if columns else "",
-            ",".join( "'{}'".format( str(v) ) for v in values  ) )  )
+        columns = tuple( columns or () )
+
+        def build():
+            return "INSERT INTO {} {} VALUES ({})".format( self.name,
+                "({})".format( ','.join( columns ) ) if columns else "",
+                ",".join( "%s" for v in values ) )
+
+        statement = self.db.statement( self.name, ( 'insert', columns, len( values ) ), build )
+        self.db.execute( statement, tuple( str(v) for v in values ) )
 
     def delete( self, entry, columns=None ):
         '''
         Allows you to delete anything matching this entry.
         '''
 
-        self.db.execute( "DELETE FROM {} WHERE {}".format(
-            self.name, self._build_clauses( entry, columns ) ) )
+        clauses, args = self._build_clauses( entry, columns )
+        self.db.execute( "DELETE FROM {} WHERE {}".format( self.name, clauses ), args or None )
 
     def _build_clauses( self, values, columns=None ):
         '''
         A private function which will take a tuple of values, ordered according
         to the column order in the database, and build an appropriate set of
-        clauses including "IS NULL", "=", "LIKE", and quotations as appropriate.
+        clauses including "IS NULL", "=", "LIKE", with %s placeholders for the
+        values. Returns the clauses and the values to fill the placeholders with.
+        '''
+
+        shape, args = self._clause_shape( values, columns )
+        return self._format_clauses( shape ), args
+
+    def _clause_shape( self, values, columns=None ):
+        '''
+        Return the shape of the clauses matching a tuple of values, as a tuple of
+        ( column, comparison ) pairs where the comparison is one of "NULL", "=", or
+        "LIKE", along with the values to compare against. No SQL is formatted, so
+        the shape can be used to look up a statement which has already been built.
         '''
 
         # If columns are provided, they may be looking fur a custom ordering
@@ -173,13 +418,13 @@ class Table( object ):
         columns = columns or self.column_names
         column_type_dict = self.column_type_dict
 
-        # Store the clauses for later use.
-        clauses = []
+        # Store the comparisons, and the values they take, for later use.
+        shape, args = [], []
 
         # Iterate through the column-value pairs, assuming that if they gave
         # a column and not a value that they don't care what that value is.
-        for column, value in it.izip_longest( columns, values ):
-            column_type = self.column_type_dict[ column ]
+        for column, value in zip_longest( columns, values ):
+            column_type = column_type_dict[ column ]
 
             # If the entry is None, they don't care what it is and
             # thus use a wildcard
@@ -191,20 +436,35 @@ class Table( object ):
 
             # SQL NULL is the same as the string None, not the datatype None
             if value == "None": 
-                clauses.append( "{} IS NULL".format( column ) )
+                shape.append( ( column, "NULL" ) )
 
             # If the cell type is a varchar..
             elif 'varchar' in column_type:
                 if value[-1] != '*':  
                     # If they are not looking for a wild card, look for exact match  
-                    clauses.append( "{} = '{}'".format( column, value ) )
+                    shape.append( ( column, "=" ) )
+                    args.append( value )
                 else:
                     # Otherwise, allow for wild card
-                    clauses.append( "{} LIKE '%{}%'".format(column, value[:-1]))
-            elif 'float' in column_type or 'int' in column_type:
-                clauses.append( "{} = {}".format( column, value ) )
+                    shape.append( ( column, "LIKE" ) )
+                    args.append( "%{}%".format( value[:-1] ) )
+
+            # A wildcard matches any number, so needs no clause
+            elif ( 'float' in column_type or 'int' in column_type ) and value != '*':
+                shape.append( ( column, "=" ) )
+                args.append( value )
+
+        return tuple( shape ), tuple( args )
+
+    @staticmethod
+    def _format_clauses( shape ):
+        '''
+        Return the SQL clauses of a shape returned by _clause_shape, with %s
+        placeholders for the values, or None if there are no clauses.
+        '''
 
-        return ' AND '.join( clauses ) or None
+        return ' AND '.join( "{} IS NULL".format( column ) if comparison == "NULL" else
+            "{} {} %s".format( column, comparison ) for column, comparison in shape ) or None
 
 class GoogleSpreadsheet( object ):
     """
@@ -234,34 +494,161 @@ class GoogleSpreadsheet( object ):
 
         return self.ws.get_all_values()
 
-class MySQLDatabaseInterface( object ):
+class DatabaseInterface( object ):
     '''
-    To use mySQL servers, must download the apporpriate servers. DEPRICATED.
+    The interface shared by the databases which analyses can be cached to. Statements
+    use %s placeholders for arguments, whichever database they are executed on.
     '''
-    def __init__( self, db, user = None, password = None, host = None ):
-        import MySQLdb
-        self.db = MySQLdb.connect( host, user, password, db )
+
+    name = "Database"
+
+    def __init__( self, pool ):
+        self.pool = pool
+        self.db = self.pool.acquire()
         self.cursor = self.db.cursor()
+        self.in_transaction = False
+
+    def _statement( self, statement ):
+        return statement
 
-    def execute( self, statement ):
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, exc_type, exc_value, traceback ):
+        self.close()
+
+    def close( self ):
+        '''
+        Return the connection to the pool it was drawn from.
+        '''
+        if self.db is not None:
+            try:
+                self.cursor.close()
+            except Exception:
+                pass
+            self.pool.release( self.db )
+            self.db, self.cursor = None, None
+
+    def execute( self, statement, args=None ):
         '''
         Execute an arbitrary SQL statement. No restriction on the type of statements which
-        can be executed, except those imposed by the SQL user. 
+        can be executed, except those imposed by the SQL user. Args are passed to the cursor
+        to fill in %s placeholders in the statement.
         '''
         try:
-            self.cursor.execute( statement )
+            if args is None:
+                self.cursor.execute( self._statement( statement ) )
+            else:
+                self.cursor.execute( self._statement( statement ), args )
         except:
-            raise DatabaseError( "MySQL Error: Unable to execute statement \
-                '{}'".format(statement) )
-        self.db.commit()
+            raise DatabaseError( "{} Error: Unable to execute statement \
+                '{}'".format(self.name, statement) )
+        if not self.in_transaction:
+            self.db.commit()
+
+    def executemany( self, statement, rows ):
+        '''
+        Execute a statement with %s placeholders once for each row of values. For an INSERT,
+        the rows are sent in as few multi-row statements as the cursor can batch them into,
+        rather than one round trip per row.
+        '''
+        try:
+            self.cursor.executemany( self._statement( statement ), rows )
+        except:
+            raise DatabaseError( "{} Error: Unable to execute statement \
+                '{}'".format(self.name, statement) )
+        if not self.in_transaction:
+            self.db.commit()
+
+    @contextmanager
+    def transaction( self ):
+        '''
+        Execute all statements inside the block as a single transaction, committing once at
+        the end instead of after each statement, or rolling all of them back if there is an
+        error.
+        '''
+        self.in_transaction = True
+        try:
+            yield self
+            self.db.commit()
+        except:
+            self.db.rollback()
+            raise
+        finally:
+            self.in_transaction = False
+
+    @property
+    def lastrowid( self ):
+        '''
+        The auto-incremented ID of the last row inserted.
+        '''
+        return self.cursor.lastrowid
 
     def read( self, statement ):
         try:
-            self.cursor.execute( statement )
+            self.cursor.execute( self._statement( statement ) )
             return self.cursor.fetchall()
         except:
-            raise DatabaseError( "MySQL Error: Unable to execute statement \
-                '{}'".format(statement) )
+            raise DatabaseError( "{} Error: Unable to execute statement \
+                '{}'".format(self.name, statement) )
+
+    def has_packed_segments( self, AnalysisID ):
+        '''
+        Return whether the segments of an analysis were packed into the SegmentBlobs
+        table, rather than stored as rows of the Segments table.
+        '''
+
+        try:
+            return len( self.read( "SELECT 1 FROM SegmentBlobs JOIN Events \
+                                    ON SegmentBlobs.EventID = Events.ID \
+                                    WHERE Events.AnalysisID = {0} LIMIT 1".format( AnalysisID ) ) ) > 0
+        except DatabaseError:
+            # Databases made before segments could be packed have no SegmentBlobs table.
+            return False
+
+    def _stream_cursor( self ):
+        return self.db.cursor()
+
+    def iter_arrays( self, statement, dtypes, batch_size=65536 ):
+        '''
+        Execute a query and yield its results in batches of at most batch_size rows,
+        each as a tuple of numpy arrays, one per column, with the given dtypes. Rows are
+        streamed from the database rather than all fetched at once, so only one batch is
+        held in memory at a time. NULL values become nan, so columns which may be NULL
+        must have a float dtype.
+        '''
+
+        cursor = self._stream_cursor()
+        try:
+            try:
+                cursor.execute( self._statement( statement ) )
+            except:
+                raise DatabaseError( "{} Error: Unable to execute statement \
+                    '{}'".format(self.name, statement) )
+
+            while True:
+                rows = cursor.fetchmany( batch_size )
+                if not rows:
+                    break
+                yield tuple( np.array( [ row[i] for row in rows ], dtype=dtype )
+                             for i, dtype in enumerate( dtypes ) )
+        finally:
+            cursor.close()
+
+    def read_arrays( self, statement, dtypes, batch_size=65536 ):
+        '''
+        Execute a query and return its results as a tuple of numpy arrays, one per
+        column, with the given dtypes. The rows are streamed in batches, as in
+        iter_arrays, so the full result is never held as python tuples.
+        '''
+
+        columns = [ [] for dtype in dtypes ]
+        for batch in self.iter_arrays( statement, dtypes, batch_size ):
+            for column, values in zip( columns, batch ):
+                column.append( values )
+
+        return tuple( np.concatenate( column ) if column else np.array( [], dtype=dtype )
+                      for column, dtype in zip( columns, dtypes ) )
 
     def insert( self, table, data ):
         try:
@@ -270,8 +657,8 @@ class MySQLDatabaseInterface( object ):
                     table, self._build_insert( row ) ) )
             self.db.commit()
         except:
-            raise DatabaseError( "MySQL Error: Unable to add row ({}) \
-                to table ({})".format(row, table ) )
+            raise DatabaseError( "{} Error: Unable to add row ({}) \
+                to table ({})".format(self.name, row, table ) )
 
     def _build_insert( self, tuple ):
         return ','.join( [ '"{}"'.format( str(item).replace('"', '""').replace( "\\", "\\\\") ) 
@@ -289,6 +676,255 @@ class MySQLDatabaseInterface( object ):
                 date = date.split( seg )
         return datetime.date( int(date[0]), int(date[1]), int(date[2]) )
 
+class MySQLDatabaseInterface( DatabaseInterface ):
+    '''
+    To use mySQL servers, must download the apporpriate servers. DEPRICATED.
+    '''
+
+    name = "MySQL"
+
+    def __init__( self, db, user = None, password = None, host = None, pool_size = None ):
+        DatabaseInterface.__init__( self, get_pool( host, user, password, db, size=pool_size ) )
+
+    def _stream_cursor( self ):
+        # A server side cursor, which sends rows as they are fetched rather than all at once.
+        return self.db.cursor( MySQLdb.cursors.SSCursor )
+
+class SQLiteDatabaseInterface( DatabaseInterface ):
+    '''
+    A local SQLite database holding the same AnalysisMetadata, Events, Segments, and
+    SegmentBlobs tables as the MySQL database, created the first time the file is opened. It is opened in WAL
+    mode, so that reads are not blocked by a write, and is indexed on the columns which
+    analyses are looked up by.
+    '''
+
+    name = "SQLite"
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS AnalysisMetadata (
+            Filename TEXT, TimeStamp TEXT, ID INTEGER PRIMARY KEY,
+            EventDetector TEXT, EventDetectorParams TEXT,
+            segmenter TEXT, segmenterParams TEXT,
+            FilterOrder REAL, FilterCutoff REAL );
+        CREATE TABLE IF NOT EXISTS Events (
+            AnalysisID INTEGER, SerialID INTEGER, start REAL, end REAL,
+            mean REAL, std REAL, ID INTEGER PRIMARY KEY );
+        CREATE TABLE IF NOT EXISTS Segments (
+            EventID INTEGER, SerialID INTEGER, start REAL, end REAL,
+            mean REAL, std REAL );
+        CREATE TABLE IF NOT EXISTS SegmentBlobs (
+            EventID INTEGER, Segments BLOB );
+        CREATE INDEX IF NOT EXISTS AnalysisMetadataFilename ON AnalysisMetadata ( Filename );
+        CREATE INDEX IF NOT EXISTS EventsAnalysisID ON Events ( AnalysisID, SerialID );
+        CREATE INDEX IF NOT EXISTS SegmentsEventID ON Segments ( EventID, SerialID );
+        CREATE INDEX IF NOT EXISTS SegmentBlobsEventID ON SegmentBlobs ( EventID );
+        CREATE TRIGGER IF NOT EXISTS AnalysisMetadataTimeStamp AFTER INSERT ON AnalysisMetadata
+            WHEN NEW.TimeStamp IS NULL
+            BEGIN
+                UPDATE AnalysisMetadata SET TimeStamp = strftime( '%Y-%m-%d %H:%M:%f', 'now' )
+                WHERE ID = NEW.ID;
+            END;
+        '''
+
+    def __init__( self, db, pool_size=None ):
+        path = os.path.abspath( db )
+        DatabaseInterface.__init__( self, get_pool( None, None, None, path, size=pool_size,
+            connect=lambda: SQLiteDatabaseInterface._connect( path ) ) )
+
+    @classmethod
+    def _connect( cls, path ):
+        connection = sqlite3.connect( path, check_same_thread=False )
+        connection.execute( "PRAGMA journal_mode=WAL" )
+        connection.execute( "PRAGMA synchronous=NORMAL" )
+        connection.executescript( cls.schema )
+        return connection
+
+    def _statement( self, statement ):
+        return statement.replace( '%s', '?' )
+
+def connect( database, host=None, password=None, user=None, pool_size=None ):
+    '''
+    Return an interface to the database which analyses are cached to. If a host is given,
+    this is the MySQL database on that server, otherwise database is the path of a local
+    SQLite file. If pool_size is given, the pool of connections to the database keeps that
+    many idle connections from then on.
+    '''
+
+    if host is None:
+        return SQLiteDatabaseInterface( database, pool_size=pool_size )
+    return MySQLDatabaseInterface( db=database, host=host, password=password, user=user,
+        pool_size=pool_size )
+
+class DatabaseMirror( object ):
+    '''
+    A local SQLite copy of the analyses read from a remote database, so that loading the
+    same analysis again is served from disk rather than over the network. Each analysis
+    is copied whole the first time it is read, keyed by its AnalysisID, and is copied
+    again if the TimeStamp of its metadata in the remote database has since changed. A
+    mirror should only hold analyses from one remote database, as their IDs are kept.
+
+    >>> mirror = DatabaseMirror()
+    >>> file = File.from_database( "chenoo", host, password, user, AnalysisID=12, mirror=mirror )
+    '''
+
+    def __init__( self, path=None ):
+        self.path = path or os.path.join( os.path.expanduser( '~' ), '.pypore', 'mirror.db' )
+
+        directory = os.path.dirname( os.path.abspath( self.path ) )
+        if not os.path.isdir( directory ):
+            os.makedirs( directory )
+
+    def read_analysis( self, db, AnalysisID, timestamp=None ):
+        '''
+        Return an interface to the local database, holding an up to date copy of the
+        analysis from the remote database db. If the TimeStamp of the analysis is not
+        given, it is read from the remote database.
+        '''
+
+        if timestamp is None:
+            rows = db.read( "SELECT TimeStamp FROM AnalysisMetadata \
+                             WHERE ID = {0}".format( AnalysisID ) )
+            if len( rows ) == 0:
+                raise DatabaseError( "No analysis found with ID {}.".format( AnalysisID ) )
+            timestamp = rows[0][0]
+
+        local = SQLiteDatabaseInterface( self.path )
+        try:
+            rows = local.read( "SELECT TimeStamp FROM AnalysisMetadata \
+                                WHERE ID = {0}".format( AnalysisID ) )
+            if len( rows ) == 0 or rows[0][0] != str( timestamp ):
+                self._copy( db, local, AnalysisID, timestamp )
+        except:
+            local.close()
+            raise
+        return local
+
+    def _copy( self, db, local, AnalysisID, timestamp ):
+        '''
+        Replace the local copy of an analysis with its rows in the remote database.
+        '''
+
+        metadata = list( db.read( "SELECT * FROM AnalysisMetadata \
+                                   WHERE ID = {0}".format( AnalysisID ) )[0] )
+        metadata[1] = str( timestamp )
+
+        try:
+            blobs = [ ( event_id, bytes( blob ) ) for event_id, blob in db.read(
+                "SELECT SegmentBlobs.EventID, SegmentBlobs.Segments \
+                 FROM SegmentBlobs JOIN Events ON SegmentBlobs.EventID = Events.ID \
+                 WHERE Events.AnalysisID = {0}".format( AnalysisID ) ) ]
+        except DatabaseError:
+            # Databases made before segments could be packed have no SegmentBlobs table.
+            blobs = []
+
+        with local.transaction():
+            for table in ( 'Segments', 'SegmentBlobs' ):
+                local.execute( "DELETE FROM {0} WHERE EventID IN \
+                                (SELECT ID FROM Events WHERE AnalysisID = %s)".format( table ),
+                               ( AnalysisID, ) )
+            local.execute( "DELETE FROM Events WHERE AnalysisID = %s", ( AnalysisID, ) )
+            local.execute( "DELETE FROM AnalysisMetadata WHERE ID = %s", ( AnalysisID, ) )
+
+            local.execute( "INSERT INTO AnalysisMetadata VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)",
+                           metadata )
+
+            # Copy the events and segments a batch at a time, rather than all at once.
+            for batch in db.iter_arrays( "SELECT AnalysisID, SerialID, start, end, mean, std, ID \
+                                          FROM Events WHERE AnalysisID = {0}".format( AnalysisID ),
+                                         dtypes=( np.int64, np.int64, np.float64, np.float64,
+                                                  np.float64, np.float64, np.int64 ) ):
+                local.executemany( "INSERT INTO Events VALUES (%s,%s,%s,%s,%s,%s,%s)",
+                                   list( zip( *[ column.tolist() for column in batch ] ) ) )
+
+            for batch in db.iter_arrays( "SELECT Segments.EventID, Segments.SerialID, \
+                                                 Segments.start, Segments.end, Segments.mean, Segments.std \
+                                          FROM Segments JOIN Events ON Segments.EventID = Events.ID \
+                                          WHERE Events.AnalysisID = {0}".format( AnalysisID ),
+                                         dtypes=( np.int64, np.int64, np.float64, np.float64,
+                                                  np.float64, np.float64 ) ):
+                local.executemany( "INSERT INTO Segments VALUES (%s,%s,%s,%s,%s,%s)",
+                                   list( zip( *[ column.tolist() for column in batch ] ) ) )
+
+            if blobs:
+                local.executemany( "INSERT INTO SegmentBlobs VALUES (%s,%s)", blobs )
+
+class DatabaseWriter( object ):
+    '''
+    Write analyses to a database from a background thread, so that parsing the next file
+    does not wait on the database. Files are submitted to a queue, and a thread calls
+    to_database on each in turn. At most max_queue files wait in the queue, after which
+    submit blocks until the thread has caught up, so that a slow database cannot make
+    parsed files pile up in memory. Any error raised while writing a file is raised again
+    by the next call to flush or close.
+
+    >>> with DatabaseWriter( "analyses.db" ) as writer:
+    ...     experiment.parse( meta=True, writer=writer )
+    '''
+
+    _stop = object()
+
+    def __init__( self, database, host=None, password=None, user=None, packed=False,
+                  max_queue=4 ):
+        self.params = { 'database' : database, 'host' : host, 'password' : password,
+                        'user' : user, 'packed' : packed }
+        self.queue = queue.Queue( maxsize=max_queue )
+        self.errors = []
+        self.thread = threading.Thread( target=self._run )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, exc_type, exc_value, traceback ):
+        self.close()
+
+    def _run( self ):
+        while True:
+            file = self.queue.get()
+            try:
+                if file is self._stop:
+                    return
+                file.to_database( **self.params )
+            except Exception as e:
+                self.errors.append( ( file, e ) )
+            finally:
+                self.queue.task_done()
+
+    def submit( self, file ):
+        '''
+        Queue a file to be written, blocking while the queue is full.
+        '''
+
+        if not self.thread.is_alive():
+            raise DatabaseError( "Cannot submit a file to a closed DatabaseWriter." )
+        self.queue.put( file )
+
+    def flush( self ):
+        '''
+        Block until every file submitted so far has been written.
+        '''
+
+        self.queue.join()
+        self._raise()
+
+    def close( self ):
+        '''
+        Write every file submitted so far, then stop the thread.
+        '''
+
+        if self.thread.is_alive():
+            self.queue.put( self._stop )
+            self.thread.join()
+        self._raise()
+
+    def _raise( self ):
+        if self.errors:
+            file, error = self.errors[0]
+            self.errors = []
+            raise DatabaseError( "Unable to write {} to the database: {}".format(
+                getattr( file, 'filename', file ), error ) )
+
 class DatabaseError( Exception ):
     def __init__( self, error ):
         self.error = error
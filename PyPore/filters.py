@@ -0,0 +1,101 @@
+# filters.py
+# Contact: Jacob Schreiber
+#          jmschreiber91@gmail.com
+
+'''
+This module contains the filters which are applied to ionic current. Designing
+a filter is far more expensive than applying it to a short event, so filter
+coefficients are designed once per set of parameters and cached at the module
+level, to be shared by every event, file, and parser which uses them.
+'''
+
+import numpy as np
+
+_coefficients = {}
+
+def bessel_coefficients( order, cutoff, sampling_freq, output='ba' ):
+	'''
+	Return the coefficients of a low-pass digital bessel filter, normalizing the
+	cutoff frequency by the nyquist limit of the sampling frequency. Output can
+	be either 'ba' or 'sos', as in scipy.signal.bessel. Coefficients are cached
+	on ( order, cutoff, sampling_freq, output ), so repeated calls with the same
+	parameters do not redesign the filter.
+	'''
+
+	key = ( int( order ), float( cutoff ), float( sampling_freq ), output )
+
+	try:
+		return _coefficients[ key ]
+	except KeyError:
+		from scipy import signal
+
+		nyquist = sampling_freq / 2.
+		coefficients = signal.bessel( order, cutoff / nyquist, btype='low',
+			analog=0, output=output )
+		_coefficients[ key ] = coefficients
+		return coefficients
+
+def bessel_filtfilt( current, order, cutoff, sampling_freq ):
+	'''
+	Filter the current with a low-pass bessel filter both forwards and backwards,
+	preserving phase, using cached second-order-section coefficients. Returns a
+	new array of filtered current.
+	'''
+
+	from scipy import signal
+
+	sos = bessel_coefficients( order, cutoff, sampling_freq, output='sos' )
+	return signal.sosfiltfilt( sos, current )
+
+def chunked_filtfilt( current, order, cutoff, sampling_freq, chunk_size=2**20 ):
+	'''
+	Filter the current in place with a low-pass bessel filter both forwards and
+	backwards, chunk_size samples at a time, so that filtering a very long trace
+	needs only O(chunk_size) extra memory instead of several padded copies of it.
+	The filter state is carried from one chunk to the next, and both ends are
+	padded by odd extension exactly as scipy.signal.sosfiltfilt does, so no
+	overlap between chunks is needed.
+
+	The current must be a float32 or float64 numpy array, and is returned. For
+	float64 the result matches bessel_filtfilt to floating point rounding, within
+	1e-12 relative to the magnitude of the current. For float32 the forward pass
+	is rounded to float32 before the backward pass, so the result is within 1e-6
+	relative to the magnitude of the current.
+	'''
+
+	from scipy import signal
+
+	if current.dtype not in ( np.float32, np.float64 ):
+		raise TypeError( "Can only filter float32 or float64 current in place." )
+
+	sos = bessel_coefficients( order, cutoff, sampling_freq, output='sos' )
+	n = current.shape[0]
+
+	# Use the same padding as scipy.signal.sosfiltfilt.
+	padlen = 3 * ( 2*len( sos ) + 1 - min( ( sos[:, 2] == 0 ).sum(), ( sos[:, 5] == 0 ).sum() ) )
+	if n <= padlen:
+		current[:] = signal.sosfiltfilt( sos, current )
+		return current
+
+	zi = signal.sosfilt_zi( sos )
+
+	# Take the odd extensions of both ends before the current is overwritten.
+	head = 2*current[0] - np.array( current[padlen:0:-1], dtype=np.float64 )
+	tail = 2*current[-1] - np.array( current[-2:-padlen-2:-1], dtype=np.float64 )
+
+	# Forward pass, starting from the state after the head extension.
+	_, state = signal.sosfilt( sos, head, zi=zi*head[0] )
+	for start in range( 0, n, chunk_size ):
+		end = min( start+chunk_size, n )
+		current[start:end], state = signal.sosfilt( sos, current[start:end], zi=state )
+	tail, _ = signal.sosfilt( sos, tail, zi=state )
+
+	# Backward pass, starting from the state after the filtered tail extension.
+	tail = tail[::-1]
+	_, state = signal.sosfilt( sos, tail, zi=zi*tail[0] )
+	for end in range( n, 0, -chunk_size ):
+		start = max( end-chunk_size, 0 )
+		filtered, state = signal.sosfilt( sos, current[start:end][::-1], zi=state )
+		current[start:end] = filtered[::-1]
+
+	return current
@@ -23,7 +23,8 @@ from .core import *
 
 import pyximport
 pyximport.install( setup_args={'include_dirs':np.get_include()})
-from PyPore.cparsers import FastStatSplit
+from PyPore.cparsers import FastStatSplit, FastCoarseStatSplit
+from .filters import bessel_coefficients
 
 import json
 
@@ -111,14 +112,18 @@ class MemoryParse( object):
     '''
     A parser based on being fed previous split points, and splitting a raw file based
     those splits. Used predominately when loading previous split points from the 
-    database cache, to reconstruct a parsed file from "memory.""
+    database cache, to reconstruct a parsed file from "memory.""  If copy is False, the
+    segments are views of the current rather than copies of it.
     '''
-    def __init__( self, starts, ends ):
+    def __init__( self, starts, ends, copy=True ):
         self.starts = starts
         self.ends = ends
+        self.copy = copy
     def parse( self, current ):
-        return [ Segment( current=np.array(current[int(s):int(e)], copy=True),
+        copy = np.array if self.copy else np.asarray
+        return [ Segment( current=copy(current[int(s):int(e)]),
                           start=s,
+                          end=e,
                           duration=(e-s) ) for s, e in zip(self.starts, self.ends)]
 
 class lambda_event_parser( parser ):
@@ -564,6 +569,159 @@ class SpeedyStatSplit( parser ):
         except:
             pass
 
+class CoarseStatSplit( SpeedyStatSplit ):
+    '''
+    See cparsers.pyx FastCoarseStatSplit for full documentation. This is a
+    coarse-to-fine version of SpeedyStatSplit, which first scores candidate
+    splits every coarse_width samples and then refines the best one at full
+    resolution, giving nearly the same segmentation for a fraction of the work.
+    '''
+
+    def __init__( self, min_width=100, max_width=1000000, window_width=10000, 
+        min_gain_per_sample=None, false_positive_rate=None,
+        prior_segments_per_second=None, sampling_freq=1.e5, cutoff_freq=None,
+        coarse_width=10 ):
+
+        SpeedyStatSplit.__init__( self, min_width, max_width, window_width,
+            min_gain_per_sample, false_positive_rate, prior_segments_per_second,
+            sampling_freq, cutoff_freq )
+        self.coarse_width = coarse_width
+
+    def parse( self, current ):
+        parser = FastCoarseStatSplit( self.min_width, self.max_width, 
+            self.window_width, self.min_gain_per_sample, self.false_positive_rate,
+            self.prior_segments_per_second, self.sampling_freq, self.cutoff_freq,
+            self.coarse_width )
+        return parser.parse( current )
+
+class GatedStatSplit( SpeedyStatSplit ):
+    '''
+    A hybrid of a cheap derivative prefilter and SpeedyStatSplit. A rolling-mean
+    difference, comparing the mean of the prefilter_width samples before each point
+    to the mean of the prefilter_width samples after it, marks candidate transitions
+    wherever it passes prefilter_sigmas robust standard deviations of itself. Since
+    the difference is tested at every sample, prefilter_sigmas defaults to the
+    universal threshold sqrt( 2 ln n ) for a trace of n samples, which noise alone
+    is unlikely to pass anywhere along the trace. Splits are then only searched for
+    within min_width of the candidates, skipping long flat dwells entirely. Each point
+    in these zones is scored by the same log-variance gain as FastStatSplit, over up to
+    half a window of current on either side of it, stopping at the neighbouring splits
+    and candidate zones, and accepted if it passes the same
+    min_gain, so a split is judged on as much evidence as SpeedyStatSplit would use.
+    Steps too small to pass the prefilter threshold are not found. Dwells longer than
+    max_width are still split at max_width, as FastStatSplit does.
+    '''
+
+    def __init__( self, min_width=100, max_width=1000000, window_width=10000,
+        min_gain_per_sample=None, false_positive_rate=None,
+        prior_segments_per_second=None, sampling_freq=1.e5, cutoff_freq=None,
+        prefilter_width=None, prefilter_sigmas=None ):
+
+        SpeedyStatSplit.__init__( self, min_width, max_width, window_width,
+            min_gain_per_sample, false_positive_rate, prior_segments_per_second,
+            sampling_freq, cutoff_freq )
+        self.prefilter_width = prefilter_width
+        self.prefilter_sigmas = prefilter_sigmas
+
+    def parse( self, current ):
+        min_gain = FastStatSplit( self.min_width, self.max_width,
+            self.window_width, self.min_gain_per_sample, self.false_positive_rate,
+            self.prior_segments_per_second, self.sampling_freq, self.cutoff_freq ).min_gain
+
+        n = current.shape[0]
+        c = np.concatenate( ( [0], np.cumsum( current, dtype=np.float64 ) ) )
+        c2 = np.concatenate( ( [0], np.cumsum( np.square( current, dtype=np.float64 ) ) ) )
+
+        # Bound the context of each zone by the zone after it, so that no split is
+        # scored against current from beyond the next transition.
+        breakpoints, zones = [], self._candidate_zones( current )
+        for ( start, end ), ( high, _ ) in zip( zones, zones[1:] + [ ( n, n ) ] ):
+            low = breakpoints[-1] if breakpoints else 0
+            breakpoints.extend( self._split_zone( c, c2, start, end, low, high, min_gain ) )
+        breakpoints = self._cap_widths( breakpoints, n )
+
+        return [ Segment( current=current[start:end], start=start, duration=(end-start),
+            end=end ) for start, end in pairwise( chain( [0], breakpoints, [n] ) ) ]
+
+    def _candidate_zones( self, current ):
+        '''
+        Return a list of ( start, end ) tuples of the zones of the current which
+        contain candidate transitions, padded by min_width on either side and
+        merged where they overlap.
+        '''
+
+        n, width = current.shape[0], self.prefilter_width or self.min_width
+        pad = self.min_width
+        if n <= 2*width:
+            return [ ( 0, n ) ]
+
+        # The difference between the mean of the following and the preceding
+        # window, for every point with a full window on both sides.
+        cumsum = np.concatenate( ( [0], np.cumsum( current, dtype=np.float64 ) ) )
+        means = ( cumsum[width:] - cumsum[:-width] ) / width
+        diff = np.abs( means[width:] - means[:-width] )
+
+        # Flat stretches dominate, so the median absolute difference is a robust
+        # estimate of its spread under noise alone, even for filtered current. The
+        # threshold grows with the number of points it is tested at.
+        sigmas = self.prefilter_sigmas or np.sqrt( 2*np.log( diff.shape[0] ) )
+        threshold = sigmas * np.median( diff ) / 0.6745
+        candidates = np.where( diff > threshold )[0] + width
+        if candidates.shape[0] == 0:
+            return []
+
+        breaks = np.where( np.diff( candidates ) > 2*pad )[0]
+        starts = np.maximum( candidates[ np.concatenate( ( [0], breaks+1 ) ) ] - pad, 0 )
+        ends = np.minimum( candidates[ np.concatenate( ( breaks, [-1] ) ) ] + pad, n )
+        return list( zip( starts, ends ) )
+
+    def _split_zone( self, c, c2, start, end, low, high, min_gain ):
+        '''
+        Return the sorted splits in a zone from start to end, given the cumulative sums
+        of the current and its square. Each point is scored by the gain in log variance
+        of splitting the current from half a window before it to half a window after it,
+        bounded by low and high, the nearest splits on either side. The best point is
+        kept if it passes min_gain, and the rest of the zone on either side of it is
+        searched again, bounded by that split.
+        '''
+
+        half = self.window_width // 2
+        i = np.arange( max( start, low+self.min_width ), min( end, high-self.min_width+1 ) )
+        if i.shape[0] == 0:
+            return []
+
+        left, right = np.maximum( i-half, low ), np.minimum( i+half, high )
+
+        def log_var( a, b ):
+            mean = ( c[b] - c[a] ) / ( b-a )
+            return np.log( np.maximum( ( c2[b] - c2[a] ) / ( b-a ) - mean*mean, 1e-300 ) )
+
+        gain = ( right-left ) * log_var( left, right ) - ( i-left ) * log_var( left, i ) \
+            - ( right-i ) * log_var( i, right )
+
+        best = np.argmax( gain )
+        if gain[best] <= min_gain:
+            return []
+
+        x = int( i[best] )
+        return self._split_zone( c, c2, start, x, low, x, min_gain ) + [ x ] + \
+            self._split_zone( c, c2, x+1, end, x, high, min_gain )
+
+    def _cap_widths( self, breakpoints, n ):
+        '''
+        Add splits to any segment longer than max_width, in the same manner as
+        FastStatSplit does for windows where no split is found.
+        '''
+
+        points, last = [], 0
+        for point in chain( breakpoints, [n] ):
+            while point - last > self.max_width:
+                last = min( last+self.max_width, point-self.min_width )
+                points.append( last )
+            points.append( point )
+            last = point
+        return points[:-1]
+
 
 #########################################
 # STATE PARSERS 
@@ -582,8 +740,12 @@ class snakebase_parser( parser ):
         diff = np.abs( np.diff( current ) )
         # Find the places where the derivative is low
         tics = np.concatenate( ( [0], np.where( diff < 1e-3 )[0], [ diff.shape[0] ] ) )
-        # For pieces between these tics, make each point the cumulative sum of that piece and put it together piecewise
-        cumsum = np.concatenate( ( [ np.cumsum( diff[ tics[i] : tics[i+1] ] ) for i in range( tics.shape[0]-1 ) ] ) )
+        # For pieces between these tics, make each point the cumulative sum of that piece. This is
+        # the global cumulative sum minus its value just before the start of the piece, broadcast
+        # across the piece by repeating it once per point in the piece.
+        global_cumsum = np.cumsum( diff )
+        resets = np.concatenate( ( [0], global_cumsum ) )[ tics[:-1] ]
+        cumsum = global_cumsum - np.repeat( resets, np.diff( tics ) )
         # Find the edges where the cumulative sum passes a threshold
         split_points = np.where( np.abs( np.diff( np.where( cumsum > self.threshold, 1, 0 ) ) ) == 1 )[0] + 1
         # Return segments which do pass the threshold
@@ -623,37 +785,38 @@ class FilterDerivativeSegmenter( parser ):
 
     def parse( self, current ):
         '''
-        Apply the filter-derivative method to filter the ionic current.
+        Apply the filter-derivative method to segment the ionic current.
         '''
 
         # Filter the current using a first order Bessel filter twice, one in
-        # both directions to preserve phase
+        # both directions to preserve phase, reusing cached coefficients
         from scipy import signal
-        nyquist = self.sampling_freq / 2.
-        b, a = signal.bessel( 1, self.cutoff_freq / nyquist, btype='low', analog=0, output='ba' )
-        filtered_current = signal.filtfilt( b, a, np.array( current ).copy() )
+        b, a = bessel_coefficients( 1, self.cutoff_freq, self.sampling_freq )
+        filtered_current = signal.filtfilt( b, a, current )
 
         # Take the derivative
         deriv = np.abs( np.diff( filtered_current ) )
 
-        # Find the edges of the blocks which fulfill pass the lower threshold
-        blocks = np.where( deriv > self.low_threshold, 1, 0 )
-        block_edges = np.abs( np.diff( blocks ) )
-        tics = np.where( block_edges == 1 )[0] + 1 
-
-        # Split points are points in the each block which pass the high
-        # threshold, with a maximum of one per block 
-        split_points = [0] 
-
-        for start, end in it.izip( tics[:-1:2], tics[1::2] ): # For all pairs of edges for a block..
-            segment = deriv[ start:end ] # Save all derivatives in that block to a segment
-            if np.argmax( segment ) > self.high_threshold: # If the maximum derivative in that block is above a threshold..
-                split_points = np.concatenate( ( split_points, [ start, end ] ) ) # Save the edges of the segment 
-                # Now you have the edges of all transitions saved, and so the states are the current between these transitions
-        tics = np.concatenate( ( split_points, [ current.shape[0] ] ) )
-        tics = list(map( int, tics ))
-        return [ Segment( current=current[ tics[i]:tics[i+1] ], start=tics[i] ) 
-                    for i in range( 0, len(tics)-1, 2 ) ]
+        # Find the starts and ends of the blocks which pass the lower threshold
+        edges = np.diff( np.concatenate( ( [0], deriv > self.low_threshold, [0] ) ) )
+        starts, ends = np.where( edges == 1 )[0], np.where( edges == -1 )[0]
+
+        # Split points are the edges of each block whose maximum derivative
+        # passes the high threshold, with a maximum of one transition per block.
+        # The derivative is padded so that a block ending at the last sample
+        # still has a valid index for its end.
+        if starts.shape[0] > 0:
+            bounds = np.column_stack( ( starts, ends ) ).ravel()
+            maxima = np.maximum.reduceat( np.append( deriv, 0 ), bounds )[::2]
+            keep = maxima > self.high_threshold
+            split_points = np.column_stack( ( starts[keep], ends[keep] ) ).ravel()
+        else:
+            split_points = []
+
+        # The states are the current between these transitions
+        tics = np.concatenate( ( [0], split_points, [ current.shape[0] ] ) ).astype( int ).tolist()
+        return [ Segment( current=current[ s:e ], start=s, end=e, duration=e-s ) 
+                    for s, e in zip( tics[:-1:2], tics[1::2] ) if e > s ]
 
     def GUI( self ):
         lowThreshDefault = "1e-2"
@@ -0,0 +1,258 @@
+# tables.py
+# Contact: Jacob Schreiber
+#          jmschreiber91@gmail.com
+
+'''
+This module contains columnar stores of event and segment metadata. Instead of a
+python object for each event or segment, each piece of metadata is stored as a
+single numpy array over a whole experiment, alongside the index of the file and
+event that each row came from. This allows an experiment with millions of events
+to be filtered and summarized with vectorized numpy operations. See following:
+
+events = experiment.event_table
+long_events = events[ ( events.duration > 0.1 ) & ( events.mean > 20 ) & ( events.mean < 40 ) ]
+segments = experiment.segment_table.of_events( long_events )
+file_idx, event_idx, n_segments = segments.reduce_events( 'duration', np.size )
+'''
+
+import os
+import numpy as np
+
+class ColumnTable( object ):
+	'''
+	A table of metadata, stored as a numpy array for each column. Indexing by a column
+	name returns that column, while indexing by a slice, integer array, or boolean mask
+	returns a new table holding only those rows. Columns can also be accessed as
+	attributes.
+	'''
+
+	columns = ()
+	int_columns = ( 'file', 'event' )
+
+	def __init__( self, **columns ):
+		n = None
+		self.data = {}
+
+		for name in self.columns:
+			dtype = np.int64 if name in self.int_columns else np.float64
+			column = np.asarray( columns.get( name, [] ), dtype=dtype )
+
+			if n is None:
+				n = column.shape[0]
+			elif column.shape[0] != n:
+				raise ValueError( "Column {} has {} rows, but expected {}.".format( name,
+					column.shape[0], n ) )
+
+			self.data[ name ] = column
+
+	def __len__( self ):
+		return self.data[ self.columns[0] ].shape[0]
+
+	def __getitem__( self, key ):
+		if isinstance( key, str ):
+			return self.data[ key ]
+		if isinstance( key, ( int, np.integer ) ):
+			key = [ key ]
+		return self.__class__( **{ name: column[ key ] for name, column in self.data.items() } )
+
+	def __getattr__( self, name ):
+		try:
+			return self.__dict__[ 'data' ][ name ]
+		except KeyError:
+			raise AttributeError( "'{}' object has no attribute '{}'".format(
+				self.__class__.__name__, name ) )
+
+	def __repr__( self ):
+		return "<{} with {} rows>".format( self.__class__.__name__, len( self ) )
+
+	def to_dict( self ):
+		'''
+		Return a dict of the columns of the table.
+		'''
+
+		return dict( self.data )
+
+	def save( self, directory, prefix ):
+		'''
+		Save each column of the table to its own .npy file in the directory, named
+		prefix_column.npy, so that they can be loaded back by memory mapping.
+		'''
+
+		for name, column in self.data.items():
+			np.save( os.path.join( directory, '{}_{}.npy'.format( prefix, name ) ), column )
+
+	@classmethod
+	def load( cls, directory, prefix, mmap_mode='r' ):
+		'''
+		Load a table saved with save. By default the columns are memory mapped rather
+		than read, so only the parts of them which are used are read from disk.
+		'''
+
+		return cls( **{ name: np.load( os.path.join( directory, '{}_{}.npy'.format( prefix, name ) ),
+			mmap_mode=mmap_mode ) for name in cls.columns } )
+
+	@classmethod
+	def concatenate( cls, tables ):
+		'''
+		Return a single table holding the rows of all of the tables, in order.
+		'''
+
+		tables = list( tables )
+		if len( tables ) == 0:
+			return cls()
+		return cls( **{ name: np.concatenate([ table.data[ name ] for table in tables ])
+			for name in cls.columns } )
+
+def _column( objects, name ):
+	'''
+	Return the named attribute of each object as an array of floats, with nan for any
+	object which does not have it.
+	'''
+
+	return np.array([ getattr( obj, name, np.nan ) for obj in objects ], dtype=np.float64 )
+
+def _fill_bounds( columns ):
+	'''
+	Fill in the end of any row which only has a start and a duration.
+	'''
+
+	missing = np.isnan( columns['end'] )
+	columns['end'][ missing ] = columns['start'][ missing ] + columns['duration'][ missing ]
+
+class EventTable( ColumnTable ):
+	'''
+	The metadata of each event in a set of files, one row per event, with the index of
+	the file it is in and its index in that file.
+	'''
+
+	columns = ( 'file', 'event', 'start', 'end', 'duration', 'mean', 'std', 'min', 'max',
+		'n_segments' )
+	int_columns = ( 'file', 'event', 'n_segments' )
+
+	@classmethod
+	def from_files( cls, files, offset=0 ):
+		'''
+		Build the table from the events of a list of files. The file index of each row is
+		the position of its file in the list, plus the offset.
+		'''
+
+		file_idx, event_idx, events = [], [], []
+		for i, file in enumerate( files ):
+			file_events = getattr( file, 'events', [] )
+			file_idx.append( np.full( len( file_events ), i+offset, dtype=np.int64 ) )
+			event_idx.append( np.arange( len( file_events ), dtype=np.int64 ) )
+			events.extend( file_events )
+
+		columns = { name: _column( events, name ) for name in cls.columns[2:-1] }
+		_fill_bounds( columns )
+		columns['n_segments'] = [ len( getattr( event, 'segments', [] ) ) for event in events ]
+		columns['file'] = np.concatenate( file_idx ) if file_idx else []
+		columns['event'] = np.concatenate( event_idx ) if event_idx else []
+		return cls( **columns )
+
+class SegmentTable( ColumnTable ):
+	'''
+	The metadata of each segment in a set of files, one row per segment, with the index
+	of the file and of the event in that file which it is in. Rows are stored in order,
+	so the segments of each event are contiguous.
+	'''
+
+	columns = ( 'file', 'event', 'start', 'end', 'duration', 'mean', 'std', 'min', 'max' )
+
+	@classmethod
+	def from_files( cls, files, offset=0 ):
+		'''
+		Build the table from the segments of the events of a list of files. The file index
+		of each row is the position of its file in the list, plus the offset.
+		'''
+
+		file_idx, event_idx, segments = [], [], []
+		for i, file in enumerate( files ):
+			for j, event in enumerate( getattr( file, 'events', [] ) ):
+				event_segments = getattr( event, 'segments', [] )
+				file_idx.append( np.full( len( event_segments ), i+offset, dtype=np.int64 ) )
+				event_idx.append( np.full( len( event_segments ), j, dtype=np.int64 ) )
+				segments.extend( event_segments )
+
+		columns = { name: _column( segments, name ) for name in cls.columns[2:] }
+		_fill_bounds( columns )
+		columns['file'] = np.concatenate( file_idx ) if file_idx else []
+		columns['event'] = np.concatenate( event_idx ) if event_idx else []
+		return cls( **columns )
+
+	def event_bounds( self ):
+		'''
+		Return the file index, event index, and the start and end row of each run of
+		segments which belong to the same event.
+		'''
+
+		n = len( self )
+		if n == 0:
+			empty = np.array( [], dtype=np.int64 )
+			return empty, empty, empty, empty
+
+		changes = ( self.file[1:] != self.file[:-1] ) | ( self.event[1:] != self.event[:-1] )
+		starts = np.concatenate( ( [0], np.nonzero( changes )[0] + 1 ) )
+		ends = np.append( starts[1:], n )
+		return self.file[ starts ], self.event[ starts ], starts, ends
+
+	def reduce_events( self, column, function=np.add ):
+		'''
+		Reduce a column over the segments of each event, returning the file index, event
+		index, and reduced value for each event which has segments. The function may be a
+		numpy ufunc, such as np.add or np.maximum, which is applied to all events at once,
+		or np.size for the number of segments in each event.
+		'''
+
+		file_idx, event_idx, starts, ends = self.event_bounds()
+		if function is np.size:
+			return file_idx, event_idx, ends - starts
+		if len( starts ) == 0:
+			return file_idx, event_idx, np.array( [], dtype=np.float64 )
+		return file_idx, event_idx, function.reduceat( self.data[ column ], starts )
+
+	def of_events( self, events ):
+		'''
+		Return the segments which belong to the events in an event table.
+		'''
+
+		width = max( self.event.max() if len( self ) else 0,
+			events.event.max() if len( events ) else 0 ) + 1
+		keep = np.isin( self.file * width + self.event, events.file * width + events.event )
+		return self[ keep ]
+
+SEGMENT_BLOB_VERSION = 1
+
+def pack_segments( starts, ends, means, stds ):
+	'''
+	Pack the segments of one event into a single blob, so that they can be stored as one
+	value rather than one row per segment. The blob is a version byte, the number of
+	segments as an int64, then the starts and ends as int64 arrays and the means and stds
+	as float32 arrays, all little-endian.
+	'''
+
+	n = len( starts )
+	return b''.join([ np.array( [ SEGMENT_BLOB_VERSION ], dtype=np.uint8 ).tobytes(),
+		np.array( [ n ], dtype='<i8' ).tobytes(),
+		np.asarray( starts, dtype='<i8' ).tobytes(),
+		np.asarray( ends, dtype='<i8' ).tobytes(),
+		np.asarray( means, dtype='<f4' ).tobytes(),
+		np.asarray( stds, dtype='<f4' ).tobytes() ])
+
+def unpack_segments( blob ):
+	'''
+	Return the starts, ends, means, and stds of the segments packed into a blob by
+	pack_segments, as arrays which are views of the blob.
+	'''
+
+	blob = memoryview( blob )
+	version = np.frombuffer( blob, dtype=np.uint8, count=1 )[0]
+	if version != SEGMENT_BLOB_VERSION:
+		raise ValueError( "Unknown segment blob version {}.".format( version ) )
+
+	n = int( np.frombuffer( blob, dtype='<i8', count=1, offset=1 )[0] )
+	starts = np.frombuffer( blob, dtype='<i8', count=n, offset=9 )
+	ends = np.frombuffer( blob, dtype='<i8', count=n, offset=9+8*n )
+	means = np.frombuffer( blob, dtype='<f4', count=n, offset=9+16*n )
+	stds = np.frombuffer( blob, dtype='<f4', count=n, offset=9+20*n )
+	return starts, ends, means, stds
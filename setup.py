@@ -14,13 +14,15 @@ cmdclass = { }
 if use_cython:
     ext_modules = [
         Extension("PyPore.cparsers", [ "PyPore/cparsers.pyx" ], include_dirs=[np.get_include()] ),
-        Extension("PyPore.calignment", [ "PyPore/calignment.pyx" ], include_dirs=[np.get_include()] )
+        Extension("PyPore.calignment", [ "PyPore/calignment.pyx" ], include_dirs=[np.get_include()] ),
+        Extension("PyPore.cstats", [ "PyPore/cstats.pyx" ], include_dirs=[np.get_include()] )
     ]
     cmdclass.update({ 'build_ext': build_ext })
 else:
     ext_modules = [
         Extension("PyPore.cparsers", [ "PyPore/cparsers.c" ], include_dirs=[np.get_include()] ),
-        Extension("PyPore.calignment", [ "PyPore/calignment.c" ], include_dirs=[np.get_include()] )
+        Extension("PyPore.calignment", [ "PyPore/calignment.c" ], include_dirs=[np.get_include()] ),
+        Extension("PyPore.cstats", [ "PyPore/cstats.c" ], include_dirs=[np.get_include()] )
     ]
 
 setup(